@@ -0,0 +1,5 @@
+import sys
+from os.path import join, dirname
+
+# Make the server modules importable when running benchmarks from the server directory
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
@@ -0,0 +1,361 @@
+"""Benchmark the scheduler on synthetic users, emitting JSON results which can be compared between commits.
+
+Users are generated at several calendar densities, from light days up to tight and infeasible ones, since the slowest
+requests come from the latter. Each user's week is solved the same way the schedule builders solve it (daily habits, then
+weekly habits, then work sessions), and monthly/yearly events are expanded with the recurrence expander. Tight and infeasible
+calendars are generated separately for each solve, with free time sized from that solve's own items, so that tight solves
+always have a schedule and infeasible ones never do.
+
+Run from the server directory with:
+    python -m benchmarks.calendars --output results.json
+    python -m benchmarks.calendars --output new.json --compare results.json
+"""
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from math import ceil, floor
+from random import Random
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import Optional
+import json
+import platform
+import subprocess
+
+from faker import Faker
+from polyfactory import Use
+from polyfactory.factories import DataclassFactory
+from pytz import utc
+
+from models.schedule_item import ScheduleItemTypeEnum
+from lib.constraint import TimeBlock, ScheduleItemDetails, StartIntervals, SECONDS_PER_DAY, DAYS_PER_WEEK, BITSET_ENGINE, SolverStats, \
+    solve_start_intervals, find_unfittable_items
+from lib.event import REPEAT_RULE_MONTHS, get_calendar_instance_start_times
+
+SECONDS_PER_INTERVAL = 60 * 15
+DENSITIES = ("light", "busy", "tight", "infeasible")
+
+# Same budgets as the default server settings
+MAX_NODES = 100000
+TIME_LIMIT = 1.0
+
+# Preferred time windows (in seconds from the start of the day), as used by the schedule builders
+PREFERRED_TIMES = {
+    "morning": [(6 * 3600, 12 * 3600)],
+    "afternoon": [(12 * 3600, 18 * 3600)],
+    "evening": [(18 * 3600, 21 * 3600)],
+    "night": [(21 * 3600, 24 * 3600), (0, 6 * 3600)]
+}
+
+rng = Random(0)
+
+@dataclass
+class SyntheticHabit:
+    name: str
+    duration: int # in minutes
+    frequency: int # instances per week, for weekly habits
+    preferred_times: list[str]
+
+@dataclass
+class SyntheticRecurringEvent:
+    start_time: datetime
+    duration: timedelta
+    until: Optional[datetime]
+    repeat_rule: str
+
+@dataclass
+class SyntheticUser:
+    name: str
+    wake_up_hour: int
+    sleep_hour: int
+    start_of_work_day: int # hour
+    end_of_work_day: int # hour
+    break_length: int # in minutes
+    best_focus_time: tuple[int, int] # start and end hour
+    daily_habits: list[SyntheticHabit] = field(default_factory=list)
+    weekly_habits: list[SyntheticHabit] = field(default_factory=list)
+    recurring_events: list[SyntheticRecurringEvent] = field(default_factory=list)
+
+def generate_focus_time() -> tuple[int, int]:
+    start_hour = rng.randint(8, 14)
+    return (start_hour, start_hour + rng.randint(1, 4))
+
+class SyntheticHabitFactory(DataclassFactory[SyntheticHabit]):
+    name = Use(lambda: SyntheticHabitFactory.__faker__.unique.word().capitalize())
+    duration = Use(lambda: rng.choice([15, 30, 45, 60, 90]))
+    frequency = Use(lambda: rng.randint(1, 5))
+    preferred_times = Use(lambda: rng.sample(list(PREFERRED_TIMES), rng.randint(0, 2)))
+
+class SyntheticRecurringEventFactory(DataclassFactory[SyntheticRecurringEvent]):
+    start_time = Use(lambda: SyntheticRecurringEventFactory.__faker__.date_time_between("-5y", "now", tzinfo=utc).replace(minute=0, second=0, microsecond=0))
+    duration = Use(lambda: timedelta(minutes=rng.choice([30, 60, 120, 24 * 60])))
+    until = Use(lambda: None if (rng.random() < 0.7) else SyntheticRecurringEventFactory.__faker__.date_time_between("-1y", "+5y", tzinfo=utc))
+    repeat_rule = Use(lambda: rng.choice(list(REPEAT_RULE_MONTHS)))
+
+class SyntheticUserFactory(DataclassFactory[SyntheticUser]):
+    name = Use(lambda: SyntheticUserFactory.__faker__.name())
+    wake_up_hour = Use(lambda: rng.randint(5, 9))
+    sleep_hour = Use(lambda: rng.randint(21, 23))
+    start_of_work_day = Use(lambda: rng.randint(7, 10))
+    end_of_work_day = Use(lambda: rng.randint(16, 19))
+    break_length = Use(lambda: rng.choice([0, 5, 10, 15, 30, 60]))
+    best_focus_time = Use(lambda: generate_focus_time())
+
+def seed(value: int) -> None:
+    rng.seed(value)
+    Faker.seed(value)
+    for factory in (SyntheticHabitFactory, SyntheticRecurringEventFactory, SyntheticUserFactory):
+        factory.seed_random(value)
+    SyntheticHabitFactory.__faker__.unique.clear()
+
+def generate_user(density: str) -> SyntheticUser:
+    num_daily_habits, num_weekly_habits = {
+        "light": (rng.randint(0, 2), rng.randint(0, 2)),
+        "busy": (rng.randint(2, 4), rng.randint(2, 4)),
+        "tight": (rng.randint(2, 4), rng.randint(3, 5)),
+        "infeasible": (rng.randint(3, 5), rng.randint(3, 6))
+    }[density]
+    return SyntheticUserFactory.build(
+        daily_habits=SyntheticHabitFactory.batch(num_daily_habits, frequency=1),
+        weekly_habits=SyntheticHabitFactory.batch(num_weekly_habits),
+        recurring_events=SyntheticRecurringEventFactory.batch(rng.randint(0, 20))
+    )
+
+def get_hour_blocks(start_hour: int, end_hour: int) -> list[TimeBlock]:
+    """Get the time blocks covering the hours from the start to the end hour, which may wrap past midnight"""
+    if (start_hour > end_hour):
+        return [(start_hour * 3600, SECONDS_PER_DAY)] + ([(0, end_hour * 3600)] if (end_hour != 0) else [])
+    return [(start_hour * 3600, end_hour * 3600)]
+
+def generate_events(density: str, user: SyntheticUser) -> list[TimeBlock]:
+    """Generate a day of events for a light or busy day"""
+    day_start = user.wake_up_hour * 3600
+    day_end = user.sleep_hour * 3600
+    events = []
+    for _ in range(rng.randint(0, 2) if (density == "light") else rng.randint(3, 6)):
+        start = rng.randrange(day_start, day_end - 1800, 900)
+        events.append((start, min(start + rng.choice([1800, 3600, 5400, 7200]), SECONDS_PER_DAY)))
+    return events
+
+def generate_packed_events(density: str, items: list[ScheduleItemDetails], day_start: int, day_end: int) -> list[TimeBlock]:
+    """Book the time between the start and end of the day (in seconds) except for a few free windows which the items exactly
+    fill in some order. Tight days add up to an hour of slack to the windows, so the items always fit but may need a search to
+    pack, and infeasible days take up to an hour away, so the items never fit"""
+    # Split a random order of the items into windows at item boundaries
+    durations = [ceil(duration / SECONDS_PER_INTERVAL) for _, duration, _ in items]
+    rng.shuffle(durations)
+    cuts = sorted(rng.sample(range(1, len(durations)), min(rng.randint(0, 3), max(len(durations) - 1, 0))))
+    windows = [sum(durations[start:end]) for start, end in zip([0] + cuts, cuts + [len(durations)])]
+
+    # Add or take away intervals from random windows
+    for _ in range(rng.randint(0, 4) if (density == "tight") else rng.randint(1, 4)):
+        if (density == "tight"):
+            windows[rng.randrange(len(windows))] += 1
+        else:
+            nonempty_windows = [i for i, window in enumerate(windows) if window > 0]
+            if (len(nonempty_windows) == 0):
+                break
+            windows[rng.choice(nonempty_windows)] -= 1
+
+    # Place the windows in order between events
+    windows = [window * SECONDS_PER_INTERVAL for window in windows if window > 0]
+    busy_time = day_end - day_start - sum(windows)
+    gaps = sorted(rng.randrange(0, max(busy_time, 1), SECONDS_PER_INTERVAL) for _ in range(len(windows)))
+
+    events = []
+    time = day_start
+    previous_gap = 0
+    for window, gap in zip(windows, gaps):
+        events.append((time, time + gap - previous_gap))
+        time += gap - previous_gap + window
+        previous_gap = gap
+    events.append((time, day_end))
+    return [event for event in events if (event[1] > event[0])]
+
+def get_placed_blocks(items: list[ScheduleItemDetails], start_intervals: Optional[StartIntervals]) -> list[TimeBlock]:
+    if (start_intervals == None):
+        return []
+    return [
+        (start_interval * SECONDS_PER_INTERVAL, (start_interval + ceil(duration / SECONDS_PER_INTERVAL)) * SECONDS_PER_INTERVAL)
+        for (_, duration, _), start_interval in zip(items, start_intervals) if start_interval != None
+    ]
+
+def get_result(start_intervals: Optional[StartIntervals]) -> str:
+    if (start_intervals == None):
+        return "infeasible"
+    return "partial" if (None in start_intervals) else "solved"
+
+def time_solve(
+    case_id: str,
+    group: str,
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    greedy: bool
+) -> tuple[dict, Optional[StartIntervals]]:
+    # Run the pre-check first, as the schedule builders do
+    start = perf_counter()
+    start_intervals, stats = None, SolverStats()
+    if (len(find_unfittable_items(time_blocks, items, num_intervals, SECONDS_PER_INTERVAL)) == 0):
+        start_intervals, stats = solve_start_intervals(
+            time_blocks, items, preferred_times, preferred_spacing, num_intervals, SECONDS_PER_INTERVAL, BITSET_ENGINE, MAX_NODES, TIME_LIMIT, greedy
+        )
+    elapsed = perf_counter() - start
+    return {
+        "id": case_id,
+        "group": group,
+        "items": len(items),
+        "result": get_result(start_intervals),
+        "greedy": stats.greedy_solves != 0,
+        "ms": round(elapsed * 1000, 3),
+        "nodes": stats.nodes
+    }, start_intervals
+
+def benchmark_user(user_id: int, density: str, user: SyntheticUser, greedy: bool) -> list[dict]:
+    """Solve a week for the user the same way the weekly schedule builder does. On light and busy days, the items placed by each
+    solve are booked for the next, as they are by the builders. Tight and infeasible calendars are generated for each solve"""
+    cases = []
+    packed = density in ("tight", "infeasible")
+    sleep_blocks = get_hour_blocks(user.sleep_hour, user.wake_up_hour)
+    work_sessions = [("Work session", 3600, ScheduleItemTypeEnum.FOCUS_SESSION)] * 4
+    daily_items = [(habit.name, habit.duration * 60, ScheduleItemTypeEnum.HABIT) for habit in user.daily_habits]
+    daily_preferred_times = [sum((PREFERRED_TIMES[name] for name in habit.preferred_times), []) for habit in user.daily_habits]
+
+    daily_blocks = []
+    for day in range(DAYS_PER_WEEK):
+        # Daily habits
+        events = generate_packed_events(density, daily_items, user.wake_up_hour * 3600, user.sleep_hour * 3600) if packed else generate_events(density, user)
+        time_blocks = sleep_blocks + events
+        case, start_intervals = time_solve(f"{user_id}/daily_habits/{day}", f"daily_habits/{density}", time_blocks, daily_items, daily_preferred_times, 3600, SECONDS_PER_DAY // SECONDS_PER_INTERVAL, greedy)
+        cases.append(case)
+        daily_blocks.append(time_blocks + get_placed_blocks(daily_items, start_intervals))
+
+    # Weekly habits
+    weekly_items = []
+    weekly_preferred_times = []
+    for habit in user.weekly_habits:
+        preferred_times = [(start + day * SECONDS_PER_DAY, end + day * SECONDS_PER_DAY) for name in habit.preferred_times for start, end in PREFERRED_TIMES[name] for day in range(DAYS_PER_WEEK)]
+        weekly_items += [(habit.name, habit.duration * 60, ScheduleItemTypeEnum.HABIT)] * habit.frequency
+        weekly_preferred_times += [preferred_times] * habit.frequency
+    if (len(weekly_items) != 0):
+        # Share the weekly habits between the days of a packed week
+        week_blocks = daily_blocks
+        if (packed):
+            shuffled_items = rng.sample(weekly_items, len(weekly_items))
+            week_blocks = [
+                sleep_blocks + generate_packed_events(density, shuffled_items[day::DAYS_PER_WEEK], user.wake_up_hour * 3600, user.sleep_hour * 3600)
+                for day in range(DAYS_PER_WEEK)
+            ]
+        time_blocks = [(start + day * SECONDS_PER_DAY, end + day * SECONDS_PER_DAY) for day, blocks in enumerate(week_blocks) for start, end in blocks]
+        preferred_spacing = floor(SECONDS_PER_DAY * DAYS_PER_WEEK / len(weekly_items))
+        case, start_intervals = time_solve(f"{user_id}/weekly_habits", f"weekly_habits/{density}", time_blocks, weekly_items, weekly_preferred_times, preferred_spacing, SECONDS_PER_DAY * DAYS_PER_WEEK // SECONDS_PER_INTERVAL, greedy)
+        cases.append(case)
+        for start, end in get_placed_blocks(weekly_items, start_intervals):
+            daily_blocks[floor(start / SECONDS_PER_DAY)].append((start % SECONDS_PER_DAY, min(end - floor(start / SECONDS_PER_DAY) * SECONDS_PER_DAY, SECONDS_PER_DAY)))
+
+    # Work sessions
+    for day in range(DAYS_PER_WEEK):
+        booked_blocks = generate_packed_events(density, work_sessions, user.start_of_work_day * 3600, user.end_of_work_day * 3600) if packed else daily_blocks[day]
+        time_blocks = booked_blocks + get_hour_blocks(user.end_of_work_day, user.start_of_work_day)
+        focus_times = get_hour_blocks(*user.best_focus_time)
+        case, _ = time_solve(f"{user_id}/work_sessions/{day}", f"work_sessions/{density}", time_blocks, work_sessions, [focus_times] * 4, user.break_length * 60, SECONDS_PER_DAY // SECONDS_PER_INTERVAL, greedy)
+        cases.append(case)
+
+    return cases
+
+def benchmark_recurrence(user_id: int, density: str, user: SyntheticUser) -> list[dict]:
+    """Time expanding the user's monthly and yearly events over a week and over a year"""
+    cases = []
+    range_start = datetime(2024, 3, 4, tzinfo=utc)
+    for span_name, span in (("week", timedelta(days=7)), ("year", timedelta(days=365))):
+        start = perf_counter()
+        num_instances = sum(
+            sum(1 for _ in get_calendar_instance_start_times(event.start_time, event.duration, event.until, REPEAT_RULE_MONTHS[event.repeat_rule], range_start, range_start + span))
+            for event in user.recurring_events
+        )
+        elapsed = perf_counter() - start
+        cases.append({"id": f"{user_id}/recurrence/{span_name}", "group": f"recurrence/{span_name}", "items": num_instances, "ms": round(elapsed * 1000, 3)})
+    return cases
+
+def summarize(cases: list[dict]) -> dict[str, dict]:
+    groups = {}
+    for case in cases:
+        groups.setdefault(case["group"], []).append(case)
+
+    summary = {}
+    for group, group_cases in sorted(groups.items()):
+        timings = sorted(case["ms"] for case in group_cases)
+        percentiles = quantiles(timings, n=100, method="inclusive") if (len(timings) > 1) else timings * 99
+        summary[group] = {
+            "cases": len(group_cases),
+            "mean_ms": round(mean(timings), 3),
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "p99_ms": round(percentiles[98], 3),
+            "max_ms": timings[-1],
+            "results": {result: sum(1 for case in group_cases if case.get("result") == result) for result in ("solved", "partial", "infeasible")},
+            "greedy": sum(1 for case in group_cases if case.get("greedy"))
+        }
+    return summary
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(seed_value: int, users_per_density: int, greedy: bool = True) -> dict:
+    seed(seed_value)
+    cases = []
+    for density in DENSITIES:
+        for i in range(users_per_density):
+            user = generate_user(density)
+            user_id = f"{density}/{i}"
+            cases += benchmark_user(user_id, density, user, greedy)
+            cases += benchmark_recurrence(user_id, density, user)
+
+    return {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "seed": seed_value,
+        "users_per_density": users_per_density,
+        "greedy": greedy,
+        "summary": summarize(cases),
+        "cases": cases
+    }
+
+def print_summary(summary: dict[str, dict], previous_summary: Optional[dict[str, dict]] = None) -> None:
+    print(f"{"group":<28}{"cases":>6}{"greedy":>8}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}  solved/partial/infeasible")
+    for group, stats in summary.items():
+        results = "/".join(str(count) for count in stats["results"].values())
+        line = f"{group:<28}{stats["cases"]:>6}{stats.get("greedy", 0):>8}{stats["p50_ms"]:>10.2f}{stats["p99_ms"]:>10.2f}{stats["max_ms"]:>10.2f}  {results}"
+
+        # Show the change in p99 against previous results
+        if (previous_summary != None and group in previous_summary and previous_summary[group]["p99_ms"] > 0):
+            line += f"  p99 x{stats["p99_ms"] / previous_summary[group]["p99_ms"]:.2f}"
+        print(line)
+
+def main() -> None:
+    parser = ArgumentParser(description="Benchmark the scheduler on synthetic calendars")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=10, help="number of users generated for each density")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--compare", help="JSON results from a previous run to compare against")
+    parser.add_argument("--no-greedy", action="store_true", help="always search instead of trying a greedy placement first")
+    args = parser.parse_args()
+
+    results = run(args.seed, args.users, not args.no_greedy)
+    previous_summary = None
+    if (args.compare != None):
+        with open(args.compare) as previous_results:
+            previous_summary = json.load(previous_results)["summary"]
+    print_summary(results["summary"], previous_summary)
+
+    if (args.output != None):
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Compare the constraint solver search engines on a fixed corpus of scheduling problems, then compare backtracking against
+local search on large weekly problems.
+
+Run from the server directory with:
+    python -m benchmarks.solver
+"""
+from random import Random
+from math import ceil
+from time import perf_counter
+import tracemalloc
+
+from models.schedule_item import ScheduleItemTypeEnum
+from lib.constraint import TimeBlock, ScheduleItemDetails, Solution, PartialSolution, SECONDS_PER_DAY, DAYS_PER_WEEK, LIST_ENGINE, BITSET_ENGINE, \
+    MIN_CONFLICTS_ENGINE, get_interval_range, solve
+
+type Problem = tuple[str, list[TimeBlock], list[ScheduleItemDetails], list[list[TimeBlock]], int]
+
+SECONDS_PER_INTERVAL = 60 * 15
+ENGINES = (LIST_ENGINE, BITSET_ENGINE)
+LARGE_PROBLEM_ENGINES = (BITSET_ENGINE, MIN_CONFLICTS_ENGINE)
+PREFERRED_TIMES = [[(6 * 3600, 12 * 3600)], [(12 * 3600, 18 * 3600)], [(18 * 3600, 21 * 3600)], [(21 * 3600, 24 * 3600), (0, 6 * 3600)]]
+
+def generate_daily_problem(rng: Random) -> Problem:
+    # Sleep and non-work hours
+    time_blocks = [(23 * 3600, 24 * 3600), (0, 7 * 3600), (17 * 3600, 24 * 3600), (0, 9 * 3600)]
+
+    # Events
+    for _ in range(rng.randint(0, 4)):
+        start = rng.randrange(7 * 3600, 23 * 3600, 1800)
+        time_blocks.append((start, min(start + rng.choice([1800, 3600, 5400]), SECONDS_PER_DAY)))
+
+    # Work sessions
+    focus_start = rng.randrange(9 * 3600, 15 * 3600, 3600)
+    items = [("Work session", 3600, ScheduleItemTypeEnum.FOCUS_SESSION) for _ in range(4)]
+    preferred_times = [[(focus_start, focus_start + 2 * 3600)] for _ in range(4)]
+    return ("daily", time_blocks, items, preferred_times, rng.choice([0, 600, 900, 1800]))
+
+def generate_weekly_problem(rng: Random) -> Problem:
+    # Sleep hours for every day of the week
+    time_blocks = []
+    for day in range(DAYS_PER_WEEK):
+        time_blocks += [(day * SECONDS_PER_DAY, day * SECONDS_PER_DAY + 7 * 3600), (day * SECONDS_PER_DAY + 23 * 3600, (day + 1) * SECONDS_PER_DAY)]
+
+    # Events
+    for _ in range(rng.randint(0, 20)):
+        start = rng.randrange(0, SECONDS_PER_DAY * DAYS_PER_WEEK - 3600, 1800)
+        time_blocks.append((start, start + rng.choice([1800, 3600, 7200])))
+
+    # Weekly habit instances
+    items = []
+    preferred_times = []
+    for i in range(rng.randint(1, 3)):
+        frequency = rng.randint(1, 4)
+        duration = rng.choice([900, 1800, 3600])
+        daily_preferred_times = rng.choice(PREFERRED_TIMES)
+        weekly_preferred_times = [(start + day * SECONDS_PER_DAY, end + day * SECONDS_PER_DAY) for start, end in daily_preferred_times for day in range(DAYS_PER_WEEK)]
+        items += [(f"Habit {i}", duration, ScheduleItemTypeEnum.HABIT)] * frequency
+        preferred_times += [weekly_preferred_times] * frequency
+
+    return ("weekly", time_blocks, items, preferred_times, SECONDS_PER_DAY * DAYS_PER_WEEK // len(items))
+
+def generate_large_weekly_problem(rng: Random) -> Problem:
+    """Generate a week with many weekly habit instances, leaving little more free time than the habits need"""
+    items = []
+    preferred_times = []
+    for i in range(rng.randint(6, 12)):
+        frequency = rng.randint(4, 6)
+        duration = rng.choice([900, 1800, 3600, 5400])
+        weekly_preferred_times = [(start + day * SECONDS_PER_DAY, end + day * SECONDS_PER_DAY) for start, end in rng.choice(PREFERRED_TIMES) for day in range(DAYS_PER_WEEK)]
+        items += [(f"Habit {i}", duration, ScheduleItemTypeEnum.HABIT)] * frequency
+        preferred_times += [weekly_preferred_times] * frequency
+
+    # Two free windows a day, sized so the free time is a little more than the total habit duration
+    free_time = sum(duration for _, duration, _ in items) * rng.choice([1.0, 1.05, 1.2])
+    window_length = ceil(free_time / (2 * DAYS_PER_WEEK) / SECONDS_PER_INTERVAL) * SECONDS_PER_INTERVAL
+    time_blocks = []
+    previous_window_end = 0
+    for window in range(2 * DAYS_PER_WEEK):
+        window_start = window * SECONDS_PER_DAY // 2 + rng.randrange(0, SECONDS_PER_DAY // 2 - window_length, SECONDS_PER_INTERVAL)
+        time_blocks.append((previous_window_end, window_start))
+        previous_window_end = window_start + window_length
+    time_blocks.append((previous_window_end, SECONDS_PER_DAY * DAYS_PER_WEEK))
+
+    return ("weekly", time_blocks, items, preferred_times, SECONDS_PER_DAY * DAYS_PER_WEEK // len(items))
+
+def generate_corpus(seed: int, size: int) -> list[Problem]:
+    rng = Random(seed)
+    return [generate_daily_problem(rng) if (i % 2 == 0) else generate_weekly_problem(rng) for i in range(size)]
+
+def describe_solution(solution: Solution | None) -> list[tuple[str, int, int]] | None:
+    if (solution == None):
+        return None
+    return [(time_variable.name, time_variable.duration, start_interval) for time_variable, start_interval in solution.items()]
+
+def run_engine(engine: str, corpus: list[Problem]) -> tuple[float, list]:
+    solutions = []
+    start = perf_counter()
+    for kind, time_blocks, items, preferred_times, preferred_spacing in corpus:
+        num_intervals = (SECONDS_PER_DAY if kind == "daily" else SECONDS_PER_DAY * DAYS_PER_WEEK) // SECONDS_PER_INTERVAL
+        solution = solve(time_blocks, items, preferred_times, preferred_spacing, num_intervals, SECONDS_PER_INTERVAL, engine)
+        solutions.append(describe_solution(solution))
+    return perf_counter() - start, solutions
+
+def measure_peak_memory(engine: str, corpus: list[Problem]) -> int:
+    """Get the peak memory (in bytes) allocated by the solver across the corpus. This is measured separately from the
+    timings since tracing allocations slows down the solver"""
+    tracemalloc.start()
+    run_engine(engine, corpus)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_memory
+
+def count_preferred_hits(problem: Problem, solution: PartialSolution) -> int:
+    preferred_times = problem[3]
+    return sum(
+        1 for i, start_interval in enumerate(solution.values())
+        if start_interval != None and any(first <= start_interval <= last for first, last in (get_interval_range(time_block, SECONDS_PER_INTERVAL) for time_block in preferred_times[i]))
+    )
+
+def compare_large_problems(corpus: list[Problem], max_nodes: int, time_limit: float) -> None:
+    """Compare schedule quality and timing of the engines on large problems with the default server budgets"""
+    print(f"{"engine":>14}{"total ms":>10}{"max ms":>10}{"placed":>10}{"preferred":>11}{"infeasible":>12}")
+    for engine in LARGE_PROBLEM_ENGINES:
+        timings, placed, preferred_hits, infeasible = [], 0, 0, 0
+        for problem in corpus:
+            _, time_blocks, items, preferred_times, preferred_spacing = problem
+            start = perf_counter()
+            solution = solve(time_blocks, items, preferred_times, preferred_spacing, SECONDS_PER_DAY * DAYS_PER_WEEK // SECONDS_PER_INTERVAL, SECONDS_PER_INTERVAL, engine, max_nodes, time_limit)
+            timings.append(perf_counter() - start)
+            if (solution == None):
+                infeasible += 1
+                continue
+            placed += sum(1 for start_interval in solution.values() if start_interval != None)
+            preferred_hits += count_preferred_hits(problem, solution)
+        print(f"{engine:>14}{sum(timings) * 1000:>10.1f}{max(timings) * 1000:>10.1f}{placed:>10}{preferred_hits:>11}{infeasible:>12}")
+
+def main() -> None:
+    corpus = generate_corpus(seed=0, size=40)
+    results = {engine: run_engine(engine, corpus) for engine in ENGINES}
+
+    for engine, (elapsed, _) in results.items():
+        print(f"{engine:>8}: {elapsed * 1000:.1f} ms, peak memory {measure_peak_memory(engine, corpus) / 1024:.1f} KiB")
+
+    reference_solutions = results[ENGINES[0]][1]
+    identical = all(solutions == reference_solutions for _, solutions in results.values())
+    print(f"identical solutions: {identical}")
+
+    rng = Random(0)
+    large_corpus = [generate_large_weekly_problem(rng) for _ in range(12)]
+    print(f"\nlarge weekly problems ({sum(len(problem[2]) for problem in large_corpus)} items in total):")
+    compare_large_problems(large_corpus, max_nodes=100000, time_limit=1.0)
+
+if __name__ == "__main__":
+    main()
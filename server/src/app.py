@@ -1,8 +1,10 @@
 from litestar import Litestar
 from config.cors import cors_config
 from config.plugins import plugins
-from middleware.auth import auth_middleware
+from middleware.auth import auth_middleware, user_cache_lifespan
 from lib.exception import exception_handlers
+from lib.schedule import solver_executor_lifespan
+from lib.precompute import schedule_precompute_lifespan
 from routers.router import router
 
 app = Litestar(
@@ -10,5 +12,6 @@ app = Litestar(
     middleware=[auth_middleware],
     cors_config=cors_config,
     plugins=plugins,
-    exception_handlers=exception_handlers
+    exception_handlers=exception_handlers,
+    lifespan=[user_cache_lifespan, solver_executor_lifespan, schedule_precompute_lifespan]
 )
\ No newline at end of file
@@ -1,13 +1,28 @@
+from sqlalchemy.ext.asyncio import create_async_engine
 from litestar.contrib.sqlalchemy.plugins import SQLAlchemyAsyncConfig, SQLAlchemyPlugin
 from litestar.contrib.sqlalchemy.base import UUIDBase
 from advanced_alchemy.extensions.litestar.plugins.init.config.asyncio import autocommit_before_send_handler
-from config.settings import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, SSL_MODE
+from config.settings import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, SSL_MODE, \
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+
+# Single engine (and connection pool) shared by the plugin and the auth middleware for the lifetime of the app.
+# The plugin's lifespan disposes of it on shutdown.
+engine = create_async_engine(
+    f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={SSL_MODE}",
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
 
 db_config = SQLAlchemyAsyncConfig(
-    connection_string=f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={SSL_MODE}",
+    engine_instance=engine,
     metadata=UUIDBase.metadata,
     create_all=True,
     before_send_handler=autocommit_before_send_handler
 )
 
-plugins=[SQLAlchemyPlugin(db_config)]
\ No newline at end of file
+session_maker = db_config.create_session_maker()
+
+plugins=[SQLAlchemyPlugin(db_config)]
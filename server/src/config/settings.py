@@ -13,6 +13,12 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_NAME = os.environ.get("DB_NAME")
 SSL_MODE = os.environ.get("SSL_MODE", "allow")
 
+# Database connection pool settings
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
 # Auth database settings
 AUTH_DB_HOST = os.environ.get("AUTH_DB_HOST")
 AUTH_DB_PORT = os.environ.get("AUTH_DB_PORT")
@@ -20,7 +26,31 @@ AUTH_DB_USER = os.environ.get("AUTH_DB_USER")
 AUTH_DB_PASSWORD = os.environ.get("AUTH_DB_PASSWORD")
 AUTH_TLS_ENABLED = (os.environ.get("AUTH_TLS_ENABLED") == "True")
 
+# Authenticated user cache settings
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+
 # Token settings
 API_SECRET = os.environ.get("API_SECRET")
 ACCESS_TOKEN_MINUTE_LIFESPAN = int(os.environ.get("ACCESS_TOKEN_MINUTE_LIFESPAN"))
-REFRESH_TOKEN_HOUR_LIFESPAN = int(os.environ.get("REFRESH_TOKEN_HOUR_LIFESPAN"))
\ No newline at end of file
+REFRESH_TOKEN_HOUR_LIFESPAN = int(os.environ.get("REFRESH_TOKEN_HOUR_LIFESPAN"))
+
+# Scheduling settings
+SOLVER_ENGINE = os.environ.get("SOLVER_ENGINE", "bitset")
+SOLVER_SLOT_MINUTES = int(os.environ.get("SOLVER_SLOT_MINUTES", 15))
+SOLVER_NODE_BUDGET = int(os.environ.get("SOLVER_NODE_BUDGET", 100000))
+SOLVER_TIME_BUDGET = float(os.environ.get("SOLVER_TIME_BUDGET", 1.0))
+SOLVER_GREEDY = (os.environ.get("SOLVER_GREEDY", "True") == "True")
+SOLVER_POOL_SIZE = int(os.environ.get("SOLVER_POOL_SIZE", 2))
+SOLVER_SERVER_TIMING = (os.environ.get("SOLVER_SERVER_TIMING") == "True")
+SOLVER_REPAIR = (os.environ.get("SOLVER_REPAIR", "True") == "True")
+
+# Solver result cache settings
+SOLVER_CACHE_SIZE = int(os.environ.get("SOLVER_CACHE_SIZE", 10000))
+SOLVER_CACHE_TTL = int(os.environ.get("SOLVER_CACHE_TTL", 86400))
+SOLVER_CACHE_SHARED = (os.environ.get("SOLVER_CACHE_SHARED") == "True")
+
+# Background schedule refresh settings
+SCHEDULE_PRECOMPUTE = (os.environ.get("SCHEDULE_PRECOMPUTE", "True") == "True")
+SCHEDULE_PRECOMPUTE_DAYS = int(os.environ.get("SCHEDULE_PRECOMPUTE_DAYS", 7))
+SCHEDULE_PRECOMPUTE_SHARED = (os.environ.get("SCHEDULE_PRECOMPUTE_SHARED") == "True")
@@ -0,0 +1,9 @@
+from litestar import Controller, get
+
+from lib.metrics import collect
+
+class MetricsController(Controller):
+
+    @get(path="/")
+    async def get_metrics(self) -> dict:
+        return collect()
@@ -9,7 +9,7 @@ from domain.users.repositories import UserRepository
 from domain.users.dependencies import provide_users_repo
 from domain.users.schemas import RegisterInput, LoginInput, ChangePasswordInput
 from domain.users.dtos import UserDTO
-from middleware.auth import blacklist_store, token_family_store
+from middleware.auth import blacklist_store, token_family_store, invalidate_user
 from lib.token import parse_claims, TokenResponse
 from config.settings import REFRESH_TOKEN_HOUR_LIFESPAN
 
@@ -83,6 +83,7 @@ class UserController(Controller):
         user.password = hashed_password.decode('utf-8')
 
         await users_repo.update(user, auto_commit=True)
+        await invalidate_user(user.id)
 
     @post(path="logout", status_code=HTTP_204_NO_CONTENT)
     async def logout_user(self, cookie: Annotated[str, Parameter(cookie="refresh-token")], auth_header: Annotated[str, Parameter(header="Authorization")]) -> None:
@@ -17,8 +17,8 @@ from domain.users.events.hooks import after_event_get_request
 from domain.users.events.validators import validate_new_times, validate_event_query_parameters
 from domain.users.schedules.repositories import ScheduleRepository
 from domain.users.schedules.dependencies import provide_schedules_repo
-from lib.time import convert_to_utc
-from lib.event import get_updated_event_instance_from_event
+from lib.time import convert_to_utc, get_local_date_range, merge_date_ranges
+from lib.event import get_updated_event_instance_from_event, get_event_date_range
 
 from typing import Optional
 from datetime import datetime, time
@@ -49,7 +49,7 @@ class EventController(Controller):
         await events_repo.add(event, auto_commit=True, auto_expunge=True)
 
         # Mark schedules for refresh
-        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], *get_event_date_range(event))
 
         return event
 
@@ -89,6 +89,7 @@ class EventController(Controller):
             # Time change
             else:
                 old_until = event.until
+                old_date_range = get_event_date_range(event)
                 new_start_time, new_end_time, new_until = validate_new_times(update_data, event)
                 data.update_instance(
                     event,
@@ -101,8 +102,9 @@ class EventController(Controller):
                 if (old_until == None and new_until != None or old_until != None and new_until < old_until):
                     await updated_event_instances_repo.delete_after_date(event.id, new_until)
 
-                # Mark schedules for refresh
-                await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+                # Mark schedules for refresh across the old and new instance times
+                date_range = merge_date_ranges(old_date_range, get_event_date_range(event))
+                await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], *date_range)
 
         # Update a particular instance of the event
         elif (start != None and timezone != None):
@@ -120,6 +122,7 @@ class EventController(Controller):
                 updated_instance = get_updated_event_instance_from_event(event, start_time)
             elif (instance_type == "updated_instance"):
                 updated_instance = await updated_event_instances_repo.get_one_or_none(recurrence_id=start_time, event_id=event.id)
+            old_date_range = get_local_date_range(updated_instance.start_time, updated_instance.end_time)
 
             # No time change
             if (update_data.timezone == None):
@@ -140,9 +143,9 @@ class EventController(Controller):
             if (instance_type == "event_instance"):
                 await updated_event_instances_repo.add(updated_instance, auto_commit=True)
 
-            # Mark schedules for refresh
-            if (update_data.timezone == None):
-                await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+            # Mark schedules for refresh across the old and new instance times
+            date_range = merge_date_ranges(old_date_range, get_local_date_range(updated_instance.start_time, updated_instance.end_time))
+            await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], *date_range)
 
         # Handle missing query parameters
         else:
@@ -162,10 +165,11 @@ class EventController(Controller):
     ) -> None:
         # Delete all instances of the event
         if (event.repeat_rule == "NEVER" or (start == timezone == None)):
+            date_range = get_event_date_range(event)
             await events_repo.delete(event.id, auto_commit=True)
 
             # Mark schedules for refresh
-            await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+            await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], *date_range)
 
         # Delete a particular instance of the event
         elif (start != None and timezone != None):
@@ -182,11 +186,14 @@ class EventController(Controller):
             await exception_dates_repo.add(exception_date, auto_commit=True)
 
             # Delete updated instance if one exists
+            date_range = get_local_date_range(start_time, start_time + (event.end_time - event.start_time))
             if (instance_type == "updated_instance"):
+                updated_instance = await updated_event_instances_repo.get_one_or_none(recurrence_id=start_time, event_id=event.id)
+                date_range = get_local_date_range(updated_instance.start_time, updated_instance.end_time)
                 await updated_event_instances_repo.delete_by_start_time_and_event_id(start_time, event.id)
 
             # Mark schedules for refresh
-            await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+            await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.EVENT, ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], *date_range)
 
         # Handle missing query parameters
         else:
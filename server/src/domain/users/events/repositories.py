@@ -1,6 +1,7 @@
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
-from sqlalchemy import select, delete, and_
+from sqlalchemy import select, delete, and_, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 from datetime import datetime
 from uuid import UUID
 from math import ceil, floor
@@ -9,7 +10,7 @@ from pytz import timezone
 from models.event import Event
 from models.exception_date import ExceptionDate
 from models.updated_event_instance import UpdatedEventInstance
-from lib.event import get_event_from_updated_event_instance
+from lib.event import get_event_from_updated_event_instance, get_calendar_instance_start_times, REPEAT_RULE_MONTHS
 
 class ExceptionDateRepository(SQLAlchemyAsyncRepository[ExceptionDate]):
     """Exception Date repository"""
@@ -94,8 +95,15 @@ class EventRepository(SQLAlchemyAsyncRepository[Event]):
             event.start_time = event.start_time.astimezone(timezone_format)
             event.end_time = event.end_time.astimezone(timezone_format)
 
-        # Get recurring daily, weekly, and yearly events
-        recurring_events = await self.list(Event.repeat_rule != "NEVER", Event.repeat_rule != "MONTHLY")
+        # Only recurring events belonging to the user which have an instance that could intersect the time range
+        recurring_event_filters = (
+            Event.user_id == user_id,
+            Event.start_time < end_time,
+            or_(Event.until == None, Event.until + (Event.end_time - Event.start_time) > start_time)
+        )
+
+        # Get recurring daily and weekly events
+        recurring_events = await self.list(Event.repeat_rule.in_(("DAILY", "WEEKLY")), *recurring_event_filters)
         z1 = start_time.timestamp() # range_start
         z2 = end_time.timestamp() # range_end
         for event in recurring_events:
@@ -109,8 +117,6 @@ class EventRepository(SQLAlchemyAsyncRepository[Event]):
                     tau = 86400
                 case "WEEKLY":
                     tau = 604800
-                case "YEARLY":
-                    tau = 31536000
 
             # Get instance count
             instance_count = floor((event.until.timestamp() - event.start_time.timestamp()) / tau) + 1 if (event.until != None) else -1
@@ -140,65 +146,64 @@ class EventRepository(SQLAlchemyAsyncRepository[Event]):
                 location=event.location
             ) for m in m_lst]
 
-        # Get recurring monthly events
-        recurring_events = await self.list(Event.repeat_rule == "MONTHLY")
+        # Get recurring monthly and yearly events
+        recurring_events = await self.list(Event.repeat_rule.in_(("MONTHLY", "YEARLY")), *recurring_event_filters)
         for event in recurring_events:
-            if (event.repeat_rule == "MONTHLY"):
-                # Event properties
-                event_duration = event.end_time - event.start_time
-
-                # Initialize instance paramters and determine search bound
-                curr_start_time = event.start_time
-                curr_end_time = event.end_time
-                time_bound = end_time
-                if (event.until != None):
-                    time_bound = min(end_time, event.until)
-
-                while (curr_start_time < time_bound):
-                    # Check if the event instance and time range intersect
-                    if (curr_end_time > start_time and curr_start_time < end_time):
-                        event_lst.append(Event(
-                            id=event.id,
-                            summary=event.summary,
-                            start_time=curr_start_time.astimezone(timezone_format),
-                            end_time=curr_end_time.astimezone(timezone_format),
-                            repeat_rule=event.repeat_rule,
-                            until=event.until,
-                            description=event.description,
-                            location=event.location
-                        ))
-
-                    # Increment curr to next event instance
-                    found_next = False                  
-                    next_month = (curr_start_time.month + 1) % 12
-                    next_year = curr_start_time.year if (next_month != 1) else (curr_start_time.year + 1)
-                    while (not found_next):
-                        try:
-                            curr_start_time = curr_start_time.replace(year=next_year, month=next_month)
-                            found_next = True
-                        except ValueError:
-                            next_month = (next_month + 1) % 12
-                            if (next_month == 1):
-                                next_year += 1
-
-                    curr_end_time = curr_start_time + event_duration
-
-        # Search for updated instances in the given range
-        updated_instances_result = await self.session.execute(select(UpdatedEventInstance).join(UpdatedEventInstance.event).join(Event.user).where(and_(Event.user_id == user_id, and_(UpdatedEventInstance.start_time < end_time, UpdatedEventInstance.end_time > start_time))))
+            event_duration = event.end_time - event.start_time
+            instance_start_times = get_calendar_instance_start_times(
+                event.start_time,
+                event_duration,
+                event.until,
+                REPEAT_RULE_MONTHS[event.repeat_rule],
+                start_time,
+                end_time
+            )
+
+            # Produce events
+            event_lst += [Event(
+                id=event.id,
+                summary=event.summary,
+                start_time=instance_start_time.astimezone(timezone_format),
+                end_time=(instance_start_time + event_duration).astimezone(timezone_format),
+                repeat_rule=event.repeat_rule,
+                until=event.until,
+                description=event.description,
+                location=event.location
+            ) for instance_start_time in instance_start_times]
+
+        # Search for updated instances which either occur in the given range or replace an instance from the range
+        event_duration = Event.end_time - Event.start_time
+        updated_instances_result = await self.session.execute(
+            select(UpdatedEventInstance)
+            .join(UpdatedEventInstance.event)
+            .options(contains_eager(UpdatedEventInstance.event))
+            .where(
+                Event.user_id == user_id,
+                or_(
+                    and_(UpdatedEventInstance.start_time < end_time, UpdatedEventInstance.end_time > start_time),
+                    and_(UpdatedEventInstance.recurrence_id < end_time, UpdatedEventInstance.recurrence_id + event_duration > start_time)
+                )
+            )
+        )
         updated_instances = updated_instances_result.scalars().all()
-        overridden_instances = [(update_instance.event_id, update_instance.recurrence_id) for update_instance in updated_instances]
+        overridden_instances = {(updated_instance.event_id, updated_instance.recurrence_id) for updated_instance in updated_instances}
 
         # Search for exception dates in the given range
-        event_instances = [(event.id, event.start_time) for event in event_lst]
-        exception_dates_result = await self.session.execute(select(ExceptionDate).join(ExceptionDate.event).join(Event.user).where(Event.user_id == user_id))
-        exception_dates = exception_dates_result.scalars().all()
-        deleted_instances = [(exception_date.event_id, exception_date.start_time) for exception_date in exception_dates if (exception_date.event_id, exception_date.start_time) in event_instances]
+        exception_dates_result = await self.session.execute(
+            select(ExceptionDate.event_id, ExceptionDate.start_time)
+            .join(ExceptionDate.event)
+            .where(Event.user_id == user_id, ExceptionDate.start_time < end_time, ExceptionDate.start_time + event_duration > start_time)
+        )
+        deleted_instances = {(event_id, exception_start_time) for event_id, exception_start_time in exception_dates_result}
 
         # Filter out events overridden by updated instances, or ones that have been deleted
-        instances_to_remove = overridden_instances + deleted_instances
+        instances_to_remove = overridden_instances | deleted_instances
         event_lst = [event for event in event_lst if (event.id, event.start_time) not in instances_to_remove]
 
         # Replace events with their updated instances
-        event_lst += [get_event_from_updated_event_instance(updated_instance, timezone_format) for updated_instance in updated_instances]
+        event_lst += [
+            get_event_from_updated_event_instance(updated_instance, timezone_format) for updated_instance in updated_instances
+            if updated_instance.start_time < end_time and updated_instance.end_time > start_time
+        ]
 
         return event_lst
\ No newline at end of file
@@ -14,6 +14,7 @@ from domain.users.habits.dtos import HabitDTO, HabitCompletionDTO
 from domain.users.habits.hooks import after_habit_get_request
 from domain.users.schedules.repositories import ScheduleRepository
 from domain.users.schedules.dependencies import provide_schedules_repo
+from lib.time import get_earliest_current_date
 
 class HabitController(Controller):
     dependencies = {
@@ -46,7 +47,7 @@ class HabitController(Controller):
         await habits_repo.add(habit, auto_commit=True, auto_expunge=True)
 
         # Mark schedules for refresh
-        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], get_earliest_current_date())
 
         return habit
 
@@ -77,7 +78,7 @@ class HabitController(Controller):
         await habits_repo.update(habit, auto_commit=True)
 
         # Mark schedules for refresh
-        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION])
+        await schedules_repo.mark_schedules_for_refresh(user.id, [ScheduleItemTypeEnum.HABIT, ScheduleItemTypeEnum.FOCUS_SESSION], get_earliest_current_date())
 
     @delete(path="/{habit_name:str}")
     async def remove_habit(self, habit: Habit, habits_repo: HabitRepository) -> None:
@@ -12,6 +12,7 @@ from domain.users.preferences.schemas import SetPreferencesInput
 from domain.users.preferences.dtos import PreferenceDTO
 from domain.users.schedules.repositories import ScheduleRepository
 from domain.users.schedules.dependencies import provide_schedules_repo
+from lib.time import get_earliest_current_date
 
 class PreferenceController(Controller):
     dependencies = {"preferences_repo": Provide(provide_preferences_repo), "schedules_repo": Provide(provide_schedules_repo)}
@@ -81,7 +82,7 @@ class PreferenceController(Controller):
             await preferences_repo.add(preference, auto_commit=True)
 
         # Mark schedules for refresh
-        await schedules_repo.mark_schedules_for_refresh(user.id, list(schedule_item_types_to_refresh))
+        await schedules_repo.mark_schedules_for_refresh(user.id, list(schedule_item_types_to_refresh), get_earliest_current_date())
 
         # Send appropriate response based on whether preferences were created or updated
         if (preference_exists):
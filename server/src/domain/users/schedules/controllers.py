@@ -1,4 +1,4 @@
-from litestar import Controller, get, patch
+from litestar import Controller, Response, get, patch
 from litestar.status_codes import HTTP_204_NO_CONTENT, HTTP_409_CONFLICT
 from litestar.exceptions import ClientException, NotFoundException
 from litestar.di import Provide
@@ -9,7 +9,7 @@ from models.user import User
 from domain.users.schedules.repositories import ScheduleRepository
 from domain.users.schedules.dependencies import provide_schedules_repo
 from domain.users.schedules.schemas import UpdateScheduleItemInput
-from domain.users.schedules.dtos import ScheduleDTO
+from domain.users.schedules.dtos import ScheduleDTO, ScheduleRangeDTO
 from domain.users.preferences.repositories import PreferenceRepository
 from domain.users.preferences.dependencies import provide_preferences_repo
 from domain.users.events.repositories import EventRepository
@@ -18,11 +18,19 @@ from domain.users.events.validators import check_timezone
 from domain.users.habits.repositories import HabitRepository
 from domain.users.habits.dependencies import provide_habits_repo
 from lib.time import convert_to_utc, seconds_to_time_object
-from lib.schedule import requires_refresh, ScheduleBuilder, ScheduleDirector, WeeklyScheduleBuilder, WeeklyScheduleDirector
+from lib.schedule import requires_refresh, get_week_start, create_week_schedules, lock_week, ScheduleBuilder, ScheduleDirector, WeeklyScheduleBuilder, \
+    WeeklyScheduleDirector
+from lib.constraint import track_solver_stats
+from lib.precompute import remember_schedule_timezone
+from config.settings import SOLVER_SERVER_TIMING
 
 from datetime import date, datetime, timedelta
+from contextlib import AsyncExitStack
 from uuid import UUID
 
+# Longest range of days which can be fetched at once (enough for a month view)
+MAX_SCHEDULE_RANGE_DAYS = 42
+
 class ScheduleController(Controller):
     dependencies = {
         "schedules_repo": Provide(provide_schedules_repo),
@@ -41,40 +49,121 @@ class ScheduleController(Controller):
         events_repo: EventRepository,
         habits_repo: HabitRepository,
         timezone: str
-    ) -> Schedule:
+    ) -> Response[Schedule]:
         # Fetch schedule if already generated and does not require refresh
         schedule = await schedules_repo.get_one_or_none(user_id=user.id, date=schedule_date)
         if (schedule != None and not requires_refresh(schedule)):
-            return schedule
-
-        # Start new week
-        if (schedule == None):
-            # Create schedules for each day of the week
-            day_time_delta = timedelta(days=1)
-            schedule_date_weekday = schedule_date.weekday()
-            days = [schedule_date + (i - schedule_date_weekday) * day_time_delta for i in range(7)]
-            schedules = [Schedule(user_id=user.id, date=day) for day in days]
-
-            # Generate weekly schedule
-            schedule_builder = WeeklyScheduleBuilder(schedules)
-            schedule_director = WeeklyScheduleDirector()
-            await schedule_director.generate_schedule(schedule_builder, user, preferences_repo, events_repo, habits_repo, check_timezone(timezone))
-
-            # Save schedules
-            schedule = schedules[schedule_date_weekday]
-            await schedules_repo.add_many(schedules)
-
-        # Update schedule from the current week
-        else:
-            # Generate schedule
-            schedule_builder = ScheduleBuilder(schedule)
-            schedule_director = ScheduleDirector()
-            await schedule_director.generate_schedule(schedule_builder, user, preferences_repo, events_repo, habits_repo, check_timezone(timezone))
-
-            # Save schedule
-            await schedules_repo.update(schedule, auto_commit=True)
-
-        return schedule
+            return Response(schedule)
+
+        # Collect stats for the solves run while generating the schedule
+        solver_stats = track_solver_stats()
+        timezone_format = check_timezone(timezone)
+        await remember_schedule_timezone(user.id, timezone)
+
+        # Check the schedule again once no one else is generating the week, since they have usually just saved it
+        week_start = get_week_start(schedule_date)
+        async with lock_week(user.id, week_start):
+            schedules = await schedules_repo.get_schedules_in_range(user.id, schedule_date, schedule_date, reload=True)
+            schedule = schedules[0] if (len(schedules) != 0) else None
+
+            # Start new week
+            if (schedule == None):
+                # Create schedules for each day of the week
+                schedules = create_week_schedules(user.id, week_start)
+
+                # Generate weekly schedule
+                schedule_builder = WeeklyScheduleBuilder(schedules)
+                schedule_director = WeeklyScheduleDirector()
+                await schedule_director.generate_schedule(schedule_builder, user, preferences_repo, events_repo, habits_repo, timezone_format)
+
+                # Save schedules, keeping the week saved by another request if it got there first
+                schedule = schedules[schedule_date.weekday()]
+                if (not await schedules_repo.save_schedules(schedules)):
+                    schedule = (await schedules_repo.get_schedules_in_range(user.id, schedule_date, schedule_date, reload=True))[0]
+
+            # Update schedule from the current week
+            elif (requires_refresh(schedule)):
+                # Generate schedule
+                schedule_builder = ScheduleBuilder(schedule)
+                schedule_director = ScheduleDirector()
+                await schedule_director.generate_schedule(schedule_builder, user, preferences_repo, events_repo, habits_repo, timezone_format)
+
+                # Save schedule
+                await schedules_repo.update(schedule, auto_commit=True)
+
+        # Optionally report solver timings to the client
+        headers = {"Server-Timing": solver_stats.server_timing()} if (SOLVER_SERVER_TIMING and solver_stats.solves + solver_stats.cache_hits != 0) else None
+        return Response(schedule, headers=headers)
+
+    @get(path="/", return_dto=ScheduleRangeDTO)
+    async def get_schedules(
+        self,
+        user: User,
+        start: date,
+        end: date,
+        schedules_repo: ScheduleRepository,
+        preferences_repo: PreferenceRepository,
+        events_repo: EventRepository,
+        habits_repo: HabitRepository,
+        timezone: str
+    ) -> Response[list[Schedule]]:
+        # Validate date range
+        if (start > end):
+            raise ClientException(detail="Start date must not come after end date")
+        if ((end - start).days >= MAX_SCHEDULE_RANGE_DAYS):
+            raise ClientException(detail=f"Date range must not be longer than {MAX_SCHEDULE_RANGE_DAYS} days")
+
+        # Fetch schedules for every week overlapping the range, since weeks are generated as a whole
+        first_week_start = get_week_start(start)
+        last_week_start = get_week_start(end)
+        schedules = await schedules_repo.get_schedules_in_range(user.id, first_week_start, last_week_start + timedelta(days=6))
+        week_starts = [first_week_start + timedelta(days=7 * i) for i in range((last_week_start - first_week_start).days // 7 + 1)]
+
+        # Find weeks which are missing or have out of date days in the range
+        weeks_to_generate = set(week_starts) - {get_week_start(schedule.date) for schedule in schedules}
+        weeks_to_generate.update(get_week_start(schedule.date) for schedule in schedules if start <= schedule.date <= end and requires_refresh(schedule))
+        if (len(weeks_to_generate) == 0):
+            return Response([schedule for schedule in schedules if start <= schedule.date <= end])
+
+        # Collect stats for the solves run while generating the schedules
+        solver_stats = track_solver_stats()
+        timezone_format = check_timezone(timezone)
+        await remember_schedule_timezone(user.id, timezone)
+
+        async with AsyncExitStack() as week_locks:
+            # Lock the weeks in order, then check them again since others have usually just generated them
+            for week_start in sorted(weeks_to_generate):
+                await week_locks.enter_async_context(lock_week(user.id, week_start))
+            schedules = await schedules_repo.get_schedules_in_range(user.id, first_week_start, last_week_start + timedelta(days=6), reload=True)
+            existing_week_starts = {get_week_start(schedule.date) for schedule in schedules}
+
+            # Generate missing weeks
+            new_schedules = []
+            for week_start in sorted(weeks_to_generate - existing_week_starts):
+                week_schedules = create_week_schedules(user.id, week_start)
+                await WeeklyScheduleDirector().generate_schedule(WeeklyScheduleBuilder(week_schedules), user, preferences_repo, events_repo, habits_repo, timezone_format)
+                new_schedules += week_schedules
+
+            # Refresh schedules in the range which are out of date
+            refreshed_schedules = [
+                schedule for schedule in schedules
+                if start <= schedule.date <= end and requires_refresh(schedule) and get_week_start(schedule.date) in weeks_to_generate
+            ]
+            for schedule in refreshed_schedules:
+                await ScheduleDirector().generate_schedule(ScheduleBuilder(schedule), user, preferences_repo, events_repo, habits_repo, timezone_format)
+
+            # Save all generated schedules at once, keeping the weeks saved by another request if it got there first
+            if (len(new_schedules) != 0 or len(refreshed_schedules) != 0):
+                if (not await schedules_repo.save_schedules(new_schedules)):
+                    schedules = await schedules_repo.get_schedules_in_range(user.id, first_week_start, last_week_start + timedelta(days=6), reload=True)
+                    new_schedules = []
+
+        # Return the schedules in the range in order
+        schedules = sorted((schedule for schedule in schedules + new_schedules if start <= schedule.date <= end), key=lambda schedule: schedule.date)
+
+        # Optionally report solver timings to the client
+        headers = {"Server-Timing": solver_stats.server_timing()} if (SOLVER_SERVER_TIMING and solver_stats.solves + solver_stats.cache_hits != 0) else None
+        return Response(schedules, headers=headers)
 
     @patch(path="/{schedule_date:date}/schedule_items/{schedule_item_id:uuid}", status_code=HTTP_204_NO_CONTENT)
     async def update_schedule_item(self, data: UpdateScheduleItemInput, user: User, schedule_date: date, schedule_item_id: UUID, schedules_repo: ScheduleRepository) -> None:
@@ -12,4 +12,17 @@ class ScheduleDTO(SQLAlchemyDTO[Schedule]):
             "schedule_items.0.schedule_item_type"
         },
         rename_fields={"schedule_items.0.id": "schedule_item_id"}
-    )
\ No newline at end of file
+    )
+
+class ScheduleRangeDTO(SQLAlchemyDTO[Schedule]):
+    config = SQLAlchemyDTOConfig(
+        include={
+            "date",
+            "schedule_items.0.id",
+            "schedule_items.0.name",
+            "schedule_items.0.start_time",
+            "schedule_items.0.end_time",
+            "schedule_items.0.schedule_item_type"
+        },
+        rename_fields={"schedule_items.0.id": "schedule_item_id"}
+    )
@@ -2,22 +2,81 @@ from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from models.schedule import Schedule
 from models.schedule_item import ScheduleItemTypeEnum
 from uuid import UUID
-from sqlalchemy import update
+from datetime import date
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from redis.exceptions import RedisError
+from lib.refresh_queue import schedule_refresh_queue
+from lib.time import get_earliest_current_date
+from lib.metrics import increment
+from config.settings import SCHEDULE_PRECOMPUTE
+
+# Refresh flag set on a schedule for each type of schedule item
+REFRESH_FLAGS = {
+    ScheduleItemTypeEnum.EVENT: "requires_event_refresh",
+    ScheduleItemTypeEnum.HABIT: "requires_habit_refresh",
+    ScheduleItemTypeEnum.SLEEP: "requires_sleep_refresh",
+    ScheduleItemTypeEnum.FOCUS_SESSION: "requires_work_refresh"
+}
 
 class ScheduleRepository(SQLAlchemyAsyncRepository[Schedule]):
     """Schedule repository"""
 
     model_type = Schedule
 
-    async def mark_schedules_for_refresh(self, user_id: UUID, schedule_item_types: list[ScheduleItemTypeEnum]) -> None:
-        for schedule_item_type in schedule_item_types:
-            match schedule_item_type:
-                case ScheduleItemTypeEnum.EVENT:
-                    await self.session.execute(statement=update(Schedule).where(Schedule.user_id == user_id).values(requires_event_refresh = True))
-                case ScheduleItemTypeEnum.HABIT:
-                    await self.session.execute(statement=update(Schedule).where(Schedule.user_id == user_id).values(requires_habit_refresh = True))
-                case ScheduleItemTypeEnum.SLEEP:
-                    await self.session.execute(statement=update(Schedule).where(Schedule.user_id == user_id).values(requires_sleep_refresh = True))
-                case ScheduleItemTypeEnum.FOCUS_SESSION:
-                    await self.session.execute(statement=update(Schedule).where(Schedule.user_id == user_id).values(requires_work_refresh = True))
-        await self.session.commit()
\ No newline at end of file
+    async def mark_schedules_for_refresh(
+        self,
+        user_id: UUID,
+        schedule_item_types: list[ScheduleItemTypeEnum],
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> None:
+        """Flag the user's schedules between the start and end dates (inclusive) as requiring a refresh of the given schedule
+        item types. A missing start or end date leaves that side of the range open. Flagged schedules are queued to be refreshed
+        in the background"""
+        if (len(schedule_item_types) == 0):
+            return
+
+        # Set every requested flag in a single update
+        statement = update(Schedule).where(Schedule.user_id == user_id)
+        if (start_date != None):
+            statement = statement.where(Schedule.date >= start_date)
+        if (end_date != None):
+            statement = statement.where(Schedule.date <= end_date)
+        statement = statement.values({REFRESH_FLAGS[schedule_item_type]: True for schedule_item_type in schedule_item_types})
+
+        result = await self.session.execute(statement=statement)
+        await self.session.commit()
+
+        # Queue a background refresh, leaving it to the next read if the queue cannot be reached
+        if (SCHEDULE_PRECOMPUTE and result.rowcount != 0):
+            try:
+                await schedule_refresh_queue.push(user_id, max(start_date, get_earliest_current_date()) if (start_date != None) else get_earliest_current_date())
+            except RedisError:
+                increment("schedule_precompute_queue_errors")
+
+    async def get_schedules_in_range(self, user_id: UUID, start_date: date, end_date: date, reload: bool = False) -> list[Schedule]:
+        """Get the user's schedules between the start and end dates (inclusive) ordered by date, loading their schedule items
+        in the same query. Reloading overwrites schedules already loaded by the session with their latest saved state"""
+        result = await self.session.execute(
+            select(Schedule)
+            .options(joinedload(Schedule.schedule_items))
+            .where(Schedule.user_id == user_id, Schedule.date >= start_date, Schedule.date <= end_date)
+            .order_by(Schedule.date)
+            .execution_options(populate_existing=reload)
+        )
+        return list(result.unique().scalars().all())
+
+    async def save_schedules(self, new_schedules: list[Schedule]) -> bool:
+        """Add newly created schedules and save changes to refreshed ones in a single commit. Returns False, saving nothing,
+        if another request has already saved a schedule for one of the new days, in which case its schedules should be reloaded"""
+        self.session.add_all(new_schedules)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            increment("schedule_save_conflicts")
+            return False
+        return True
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Optional
+
+from litestar.stores.base import Store
+from redis.exceptions import RedisError
+
+class TTLCache:
+    """Bounded in-process cache which evicts the least recently used entry when full and expires entries after a time to live"""
+    maxsize: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        # Look up entry
+        entry = self._entries.get(key)
+        if (entry == None):
+            self.misses += 1
+            return None
+
+        # Drop expired entries
+        value, expires_at = entry
+        if (expires_at < monotonic()):
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        # Mark entry as most recently used
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if (self.maxsize <= 0):
+            return
+
+        # Insert entry as the most recently used
+        expires_at = monotonic() + self.ttl if (self.ttl != None) else float("inf")
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        # Evict least recently used entries
+        while (len(self._entries) > self.maxsize):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if (lookups != 0) else 0.0
+        }
+
+class TieredCache:
+    """TTLCache in front of an optional shared store (e.g. Valkey), so that entries computed by one worker can be reused by the
+    others. Values are strings so they can be written to the store as is"""
+    local_cache: TTLCache
+    store: Optional[Store]
+    ttl: Optional[int]
+    shared_hits: int
+    shared_errors: int
+
+    def __init__(self, maxsize: int, ttl: Optional[int] = None, store: Optional[Store] = None) -> None:
+        self.local_cache = TTLCache(maxsize, ttl)
+        self.store = store
+        self.ttl = ttl
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        # Check this worker's entries first
+        value = self.local_cache.get(key)
+        if (value != None or self.store == None):
+            return value
+
+        # Fall back to the shared store, treating it as a miss if it cannot be reached
+        try:
+            stored_value = await self.store.get(key)
+        except RedisError:
+            self.shared_errors += 1
+            return None
+        if (stored_value == None):
+            return None
+
+        # Keep a local copy for later lookups
+        value = stored_value.decode()
+        self.shared_hits += 1
+        self.local_cache.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        self.local_cache.set(key, value)
+        if (self.store != None):
+            try:
+                await self.store.set(key, value, expires_in=self.ttl)
+            except RedisError:
+                self.shared_errors += 1
+
+    def stats(self) -> dict[str, int | float]:
+        # Local misses which were found in the shared store still count as hits overall
+        stats = self.local_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["shared_hits"] = self.shared_hits
+        stats["shared_errors"] = self.shared_errors
+        stats["hit_ratio"] = (stats["hits"] + self.shared_hits) / lookups if (lookups != 0) else 0.0
+        return stats
@@ -1,33 +1,58 @@
-from datetime import datetime, time
+from datetime import datetime
+from time import monotonic, perf_counter
 from math import floor, ceil
-from typing import Optional, Literal, Generator
+from typing import Optional, Generator
 from uuid import UUID
-from itertools import chain
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+from random import Random
+from hashlib import sha256
+from contextvars import ContextVar
+import json
+import logging
 
 from litestar.status_codes import HTTP_409_CONFLICT
 from litestar.exceptions import ClientException
 
 from models.schedule_item import ScheduleItem, ScheduleItemTypeEnum
 from lib.time import seconds_to_time_object
+from lib.executor import run_in_solver_executor
+from lib.cache import TieredCache
+from lib.metrics import increment, register
 
 # Constants
 SECONDS_PER_DAY = 86400
 DAYS_PER_WEEK = 7
-FAILURE = "FAILURE"
+SECONDS_PER_INTERVAL = 60 * 15
+
+# Search engines
+LIST_ENGINE = "list"
+BITSET_ENGINE = "bitset"
+MIN_CONFLICTS_ENGINE = "min_conflicts"
+
+# Problems with at least this many items are solved with local search, since backtracking rarely finishes on them in time
+LOCAL_SEARCH_MIN_ITEMS = 30
+
+# Local search settings. Steps are capped when the search has no other budget, since it cannot prove a problem has no solution
+MIN_CONFLICTS_RANDOM_WALK_PROBABILITY = 0.1
+MIN_CONFLICTS_MAX_STEPS = 10000
+MIN_CONFLICTS_IMPROVEMENT_SWEEPS = 3
 
 # Type definitions
 type ScheduleItemDetails = tuple[str, int, ScheduleItemTypeEnum] # name, duration (in seconds), schedule item type
 type TimeBlock = tuple[float, float]
 type Domain = list[int]
+type BitsetDomain = int
 type Relation = callable[[dict[TimeVariable, int]], bool]
 type Constraint = tuple[list[TimeVariable], Relation]
 type PartialSolution = dict[TimeVariable, int | None]
 type Solution = dict[TimeVariable, int]
-type Failure = Literal[FAILURE]
+type StartIntervals = list[int | None] # start interval of each item in the order given, None for unplaced items
+type TrailEntry = tuple[TimeVariable] | tuple[TimeVariable, Domain | BitsetDomain] | tuple[TimeVariable, int, list[int]] # latest pruning variable, previous domain, or previous value priorities from an interval onwards
 
 class TimeVariable:
     name: str
-    duration: int # in multiples of 15 minutes
+    duration: int # in intervals
     schedule_item_type: ScheduleItemTypeEnum
     num_preferred_intervals_available: int
 
@@ -38,86 +63,540 @@ class TimeVariable:
         self.num_preferred_intervals_available = num_preferred_intervals_available
 
 class ConstraintSatisfactionProblem:
+    """Constraint satisfaction problem whose domains are sorted lists of interval numbers. The order in which values are tried
+    is given by their priorities, with lower priorities tried first"""
     variable_domains: dict[TimeVariable, Domain]
+    pruned_by: dict[TimeVariable, list[TimeVariable]]
+    interchangeable_variables: dict[TimeVariable, list[TimeVariable]]
+    preferred_values: dict[TimeVariable, BitsetDomain]
+    value_priorities: dict[TimeVariable, list[int]]
+    next_priority: int
+    constraints: list[Constraint]
+    trail: list[TrailEntry]
+
+    def __init__(
+        self,
+        variable_domains: dict[TimeVariable, Domain],
+        interchangeable_variables: dict[TimeVariable, list[TimeVariable]],
+        preferred_values: dict[TimeVariable, BitsetDomain],
+        value_priorities: dict[TimeVariable, list[int]],
+        next_priority: int,
+        constraints: list[Constraint]
+    ) -> None:
+        self.variable_domains = variable_domains
+        self.pruned_by = {var: [] for var in variable_domains}
+        self.interchangeable_variables = interchangeable_variables
+        self.preferred_values = preferred_values
+        self.value_priorities = value_priorities
+        self.next_priority = next_priority
+        self.constraints = constraints
+        self.trail = []
+
+class BitsetConstraintSatisfactionProblem:
+    """Constraint satisfaction problem whose domains are bitmasks over interval numbers. Since bits are unordered,
+    the order in which values are tried is given by their priorities, with lower priorities tried first"""
+    variable_domains: dict[TimeVariable, BitsetDomain]
+    pruned_by: dict[TimeVariable, list[TimeVariable]]
+    interchangeable_variables: dict[TimeVariable, list[TimeVariable]]
+    preferred_values: dict[TimeVariable, BitsetDomain]
+    value_priorities: dict[TimeVariable, list[int]]
+    next_priority: int
     constraints: list[Constraint]
+    trail: list[TrailEntry]
 
-    def __init__(self, variable_domains: dict[TimeVariable, Domain], constraints: list[Constraint]) -> None:
+    def __init__(self, variable_domains: dict[TimeVariable, BitsetDomain], interchangeable_variables: dict[TimeVariable, list[TimeVariable]], preferred_values: dict[TimeVariable, BitsetDomain], value_priorities: dict[TimeVariable, list[int]], next_priority: int, constraints: list[Constraint]) -> None:
         self.variable_domains = variable_domains
+        self.pruned_by = {var: [] for var in variable_domains}
+        self.interchangeable_variables = interchangeable_variables
+        self.preferred_values = preferred_values
+        self.value_priorities = value_priorities
+        self.next_priority = next_priority
         self.constraints = constraints
+        self.trail = []
+
+class SearchBudget:
+    """Limits on the number of nodes and the wall-clock time (in seconds) a search may use. While searching, the best partial
+    assignment seen so far is kept so that it can be returned if the budget runs out"""
+    max_nodes: Optional[int]
+    deadline: Optional[float]
+    nodes: int
+    best_partial_solution: Optional[PartialSolution]
+    best_partial_score: tuple[int, int]
+
+    def __init__(self, max_nodes: Optional[int] = None, time_limit: Optional[float] = None) -> None:
+        self.max_nodes = max_nodes
+        self.deadline = None if time_limit == None else monotonic() + time_limit
+        self.nodes = 0
+        self.best_partial_solution = None
+        self.best_partial_score = (-1, -1)
+
+    def is_exhausted(self) -> bool:
+        return (self.max_nodes != None and self.nodes >= self.max_nodes) or (self.deadline != None and monotonic() >= self.deadline)
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+class SolverStats:
+    """Search counters and per phase timings (in seconds) for one or more solves. Timings of solves run in parallel are summed"""
+    solves: int
+    greedy_solves: int
+    searches: int
+    nodes: int
+    values_tried: int
+    prunes: int
+    backtracks: int
+    backjumps: int
+    max_depth: int
+    local_searches: int
+    cache_hits: int
+    timings: dict[str, float]
+
+    def __init__(self) -> None:
+        self.solves = 0
+        self.greedy_solves = 0
+        self.searches = 0
+        self.nodes = 0
+        self.values_tried = 0
+        self.prunes = 0
+        self.backtracks = 0
+        self.backjumps = 0
+        self.max_depth = 0
+        self.local_searches = 0
+        self.cache_hits = 0
+        self.timings = {}
+
+    def add_timing(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def merge(self, other: "SolverStats") -> None:
+        self.solves += other.solves
+        self.greedy_solves += other.greedy_solves
+        self.searches += other.searches
+        self.nodes += other.nodes
+        self.values_tried += other.values_tried
+        self.prunes += other.prunes
+        self.backtracks += other.backtracks
+        self.backjumps += other.backjumps
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.local_searches += other.local_searches
+        self.cache_hits += other.cache_hits
+        for phase, seconds in other.timings.items():
+            self.add_timing(phase, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "solves": self.solves,
+            "greedy_solves": self.greedy_solves,
+            "searches": self.searches,
+            "nodes": self.nodes,
+            "values_tried": self.values_tried,
+            "prunes": self.prunes,
+            "backtracks": self.backtracks,
+            "backjumps": self.backjumps,
+            "max_depth": self.max_depth,
+            "local_searches": self.local_searches,
+            "cache_hits": self.cache_hits,
+            "timings_ms": {phase: round(seconds * 1000, 3) for phase, seconds in self.timings.items()}
+        }
+
+    def server_timing(self) -> str:
+        """Format the phase timings as a Server-Timing header value"""
+        metrics = [f"solver-{phase};dur={seconds * 1000:.3f}" for phase, seconds in self.timings.items()]
+        metrics.append(f'solver;desc="{self.solves} solves, {self.greedy_solves} greedy, {self.nodes} nodes, {self.backtracks} backtracks"')
+        return ", ".join(metrics)
+
+# Totals for every solve run by this worker, and the stats of the solves run for the current request (if tracked)
+logger = logging.getLogger(__name__)
+solver_totals = SolverStats()
+register("solver", solver_totals.as_dict)
+request_solver_stats: ContextVar[Optional[SolverStats]] = ContextVar("request_solver_stats", default=None)
+
+def track_solver_stats() -> SolverStats:
+    """Start collecting the stats of the solves run by the current request and any tasks it starts"""
+    stats = SolverStats()
+    request_solver_stats.set(stats)
+    return stats
+
+def record_solver_stats(stats: SolverStats) -> None:
+    solver_totals.merge(stats)
+    request_stats = request_solver_stats.get()
+    if (request_stats != None):
+        request_stats.merge(stats)
+    logger.debug("Solver stats: %s", stats.as_dict())
+
+def get_interval_range(time_block: TimeBlock, seconds_per_interval: int) -> tuple[int, int]:
+    """Get the first and last interval numbers that overlap with the time block"""
+    first_interval = floor(time_block[0] / seconds_per_interval)
+    result = time_block[1] / seconds_per_interval
+    last_interval = result - 1 if result.is_integer() else floor(result)
+    return first_interval, int(last_interval)
+
+def get_interval_mask(first_interval: int, last_interval: int) -> BitsetDomain:
+    """Get a bitmask with the bits from the first to the last interval number (inclusive) set"""
+    first_interval = max(first_interval, 0)
+    if (last_interval < first_interval):
+        return 0
+    return ((1 << (last_interval - first_interval + 1)) - 1) << first_interval
+
+def get_domain_values(domain: BitsetDomain) -> list[int]:
+    return [interval for interval, bit in enumerate(bin(domain)[:1:-1]) if bit == "1"]
+
+def undo(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, trail_mark: int) -> None:
+    """Revert the changes recorded on the trail since it had the given length"""
+    trail = csp.trail
+    while (len(trail) > trail_mark):
+        entry = trail.pop()
+        if (len(entry) == 1):
+            csp.pruned_by[entry[0]].pop()
+        elif (len(entry) == 2):
+            var, domain = entry
+            csp.variable_domains[var] = domain
+        else:
+            var, first_interval, value_priorities = entry
+            csp.value_priorities[var][first_interval:first_interval + len(value_priorities)] = value_priorities
+
+def get_domain_size(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, var: TimeVariable) -> int:
+    domain = csp.variable_domains[var]
+    return domain.bit_count() if isinstance(csp, BitsetConstraintSatisfactionProblem) else len(domain)
+
+def get_ordered_values(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, var: TimeVariable) -> list[int]:
+    """Get the values in the variable's domain in the order they should be tried"""
+    domain = csp.variable_domains[var]
+    return sorted(get_domain_values(domain) if isinstance(csp, BitsetConstraintSatisfactionProblem) else domain, key=csp.value_priorities[var].__getitem__)
+
+def record_pruning(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, var: TimeVariable, assigned_var: TimeVariable) -> None:
+    """Record that the assignment removed values from the variable's domain"""
+    csp.pruned_by[var].append(assigned_var)
+    csp.trail.append((var,))
 
-def forward_check(csp: ConstraintSatisfactionProblem, assignment: PartialSolution, assigned_var: TimeVariable, value: int, preferred_value_spacing: int) -> Failure | None:
-    """Remove domain values which are inconsistent with the given assignment. If a domain becomes empty in this process a failure is returned"""
-    # Determine interval numbers directly blocked by assignment
-    intervals_occupied = range(value, value + assigned_var.duration)
+def remove_value(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, var: TimeVariable, value: int) -> bool:
+    """Remove a value from the variable's domain, recording the previous domain on the trail. Returns whether the value was present"""
+    domain = csp.variable_domains[var]
+    if (isinstance(csp, BitsetConstraintSatisfactionProblem)):
+        if (not domain >> value & 1):
+            return False
+        csp.trail.append((var, domain))
+        csp.variable_domains[var] = domain & ~(1 << value)
+    else:
+        index = bisect_left(domain, value)
+        if (index == len(domain) or domain[index] != value):
+            return False
+        csp.trail.append((var, domain))
+        csp.variable_domains[var] = domain[:index] + domain[index + 1:]
+    return True
+
+def get_interchangeable_variables(time_variables: tuple[TimeVariable, ...], items: list[ScheduleItemDetails], preferred_times: list[list[TimeBlock]]) -> dict[TimeVariable, list[TimeVariable]]:
+    """Map each variable to the other variables with the same name, duration, type and preferred times. Any solution stays a
+    solution when the values of interchangeable variables are swapped"""
+    groups = {}
+    for i, time_variable in enumerate(time_variables):
+        groups.setdefault((items[i], tuple(preferred_times[i])), []).append(time_variable)
+    return {var: [other_var for other_var in group if other_var is not var] for group in groups.values() for var in group}
+
+def select_unassigned_variable(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, assignment: PartialSolution) -> TimeVariable:
+    """Select the unassigned variable with the fewest remaining values, breaking ties by the order of the assignment"""
+    unassigned_variables = (var for var in assignment.keys() if assignment[var] == None)
+    return min(unassigned_variables, key=lambda var: get_domain_size(csp, var))
+
+def forward_check(csp: ConstraintSatisfactionProblem, assignment: PartialSolution, assigned_var: TimeVariable, value: int, preferred_value_spacing: int, stats: SolverStats) -> Optional[TimeVariable]:
+    """Remove domain values which are inconsistent with the given assignment. If a domain becomes empty in this process its variable is returned.
+    Replaced domains and priorities are recorded on the trail so they can be restored when backtracking"""
+    first_interval = value
+    last_interval = first_interval + assigned_var.duration - 1
+
+    # Reduce unassigned variable domains based on new assignment
+    unassigned_variables = (var for var in assignment.keys() if assignment[var] == None)
+    for unassigned_var in unassigned_variables:
+        # Calculate new domain, removing start intervals which would overlap with the new assignment
+        previous_domain = csp.variable_domains[unassigned_var]
+        domain = previous_domain
+        first_removed = bisect_left(domain, first_interval - unassigned_var.duration + 1)
+        last_removed = bisect_right(domain, last_interval)
+        if (first_removed != last_removed):
+            domain = domain[:first_removed] + domain[last_removed:]
+            csp.trail.append((unassigned_var, previous_domain))
+            csp.variable_domains[unassigned_var] = domain
+            record_pruning(csp, unassigned_var, assigned_var)
+            stats.prunes += last_removed - first_removed
+
+        # Check if domain is empty
+        if (len(domain) == 0):
+            return unassigned_var
+
+        # Prioritize values away from the new assignment based on the preferred spacing, saving the previous
+        # priorities of each shifted range so they can be restored in one slice assignment
+        value_priorities = csp.value_priorities[unassigned_var]
+        ranges_to_shift = ((first_interval - preferred_value_spacing, first_interval - 1), (last_interval + 1, last_interval + preferred_value_spacing))
+        for first_shifted_interval, last_shifted_interval in ranges_to_shift:
+            first_shifted_interval = max(first_shifted_interval, 0)
+            shifted_values = domain[bisect_left(domain, first_shifted_interval):bisect_right(domain, last_shifted_interval)]
+            if (len(shifted_values) != 0):
+                csp.trail.append((unassigned_var, first_shifted_interval, value_priorities[first_shifted_interval:last_shifted_interval + 1]))
+                for interval in shifted_values:
+                    value_priorities[interval] = csp.next_priority
+                    csp.next_priority += 1
+
+def bitset_forward_check(csp: BitsetConstraintSatisfactionProblem, assignment: PartialSolution, assigned_var: TimeVariable, value: int, preferred_value_spacing: int, stats: SolverStats) -> Optional[TimeVariable]:
+    """Bitset version of forward_check. Domain reductions are applied as word operations, and only the domains and
+    priorities which actually change are recorded on the trail"""
+    first_interval = value
+    last_interval = first_interval + assigned_var.duration - 1
 
     # Reduce unassigned variable domains based on new assignment
     unassigned_variables = (var for var in assignment.keys() if assignment[var] == None)
     for unassigned_var in unassigned_variables:
-        # Calculate new domain
-        csp.variable_domains[unassigned_var] = [interval for interval in csp.variable_domains[unassigned_var] if interval not in intervals_occupied]
-        csp.variable_domains[unassigned_var] = [interval for interval in csp.variable_domains[unassigned_var] if interval not in range(value - unassigned_var.duration + 1, value)]
+        # Remove start intervals which would overlap with the new assignment
+        previous_domain = csp.variable_domains[unassigned_var]
+        domain = previous_domain & ~get_interval_mask(first_interval - unassigned_var.duration + 1, last_interval)
+        if (domain != previous_domain):
+            csp.trail.append((unassigned_var, previous_domain))
+            csp.variable_domains[unassigned_var] = domain
+            record_pruning(csp, unassigned_var, assigned_var)
+            stats.prunes += (previous_domain ^ domain).bit_count()
 
         # Check if domain is empty
-        if (len(csp.variable_domains[unassigned_var]) == 0):
-            return FAILURE
-
-        # Prioritize values away from the new assignment based on the preferred spacing
-        first_interval = value
-        last_interval = first_interval + assigned_var.duration - 1
-        intervals_to_shift = chain(range(first_interval - preferred_value_spacing, first_interval), range(last_interval + 1, last_interval + 1 + preferred_value_spacing))
-        for interval in intervals_to_shift:
-            try:
-                csp.variable_domains[unassigned_var].remove(interval)
-                csp.variable_domains[unassigned_var].append(interval)
-            except ValueError:
-                pass
-
-def backtracking_search(csp: ConstraintSatisfactionProblem, preferred_value_spacing: int) -> Optional[Solution]:
+        if (domain == 0):
+            return unassigned_var
+
+        # Prioritize values away from the new assignment based on the preferred spacing, saving the previous
+        # priorities of each shifted range so they can be restored in one slice assignment
+        value_priorities = csp.value_priorities[unassigned_var]
+        ranges_to_shift = ((first_interval - preferred_value_spacing, first_interval - 1), (last_interval + 1, last_interval + preferred_value_spacing))
+        for first_shifted_interval, last_shifted_interval in ranges_to_shift:
+            first_shifted_interval = max(first_shifted_interval, 0)
+            shifted_domain = (domain & get_interval_mask(first_shifted_interval, last_shifted_interval)) >> first_shifted_interval
+            if (shifted_domain != 0):
+                csp.trail.append((unassigned_var, first_shifted_interval, value_priorities[first_shifted_interval:last_shifted_interval + 1]))
+                for interval in get_domain_values(shifted_domain):
+                    value_priorities[first_shifted_interval + interval] = csp.next_priority
+                    csp.next_priority += 1
+
+def record_partial_solution(csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem, assignment: PartialSolution, budget: SearchBudget) -> None:
+    """Keep a copy of the assignment if it places more variables than the best one so far, or as many with more of them at preferred times"""
+    assigned_variables = [(var, value) for var, value in assignment.items() if value != None]
+    score = (len(assigned_variables), sum(csp.preferred_values[var] >> value & 1 for var, value in assigned_variables))
+    if (score > budget.best_partial_score):
+        budget.best_partial_solution = dict(assignment)
+        budget.best_partial_score = score
+
+def backtracking_search(
+    csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem,
+    preferred_value_spacing: int,
+    budget: Optional[SearchBudget] = None,
+    stats: Optional[SolverStats] = None
+) -> Optional[PartialSolution]:
+    """Search for a solution. If the budget runs out first, the best partial assignment found is returned with unplaced variables
+    left as None. None is only returned once the problem is known to have no solution"""
     empty_solution = {k: None for k in sorted(csp.variable_domains.keys(), key=lambda var: (var.duration, -var.num_preferred_intervals_available), reverse=True)}
-    return backtrack(csp, empty_solution, preferred_value_spacing)
+    try:
+        result = backtrack(csp, empty_solution, preferred_value_spacing, SolverStats() if stats == None else stats, budget)
+    except SearchBudgetExceeded:
+        return budget.best_partial_solution
+    return result if isinstance(result, dict) else None
+
+def backtrack(
+    csp: ConstraintSatisfactionProblem | BitsetConstraintSatisfactionProblem,
+    assignment: PartialSolution,
+    preferred_value_spacing: int,
+    stats: SolverStats,
+    budget: Optional[SearchBudget] = None
+) -> Solution | set[TimeVariable]:
+    """Conflict-directed backjumping search. If no solution extends the assignment, the set of assigned variables responsible
+    is returned instead so that the search can jump straight back to the most recent of them"""
+    # Track how deep the search has gone
+    depth = len(assignment) - list(assignment.values()).count(None)
+    stats.max_depth = max(stats.max_depth, depth)
 
-def backtrack(csp: ConstraintSatisfactionProblem, assignment: PartialSolution, preferred_value_spacing: int) -> Optional[Solution]:
     # Check if assignment is complete
-    if (None not in assignment.values()):
+    if (depth == len(assignment)):
         return assignment
+    stats.nodes += 1
 
-    # Select unassigned variable
-    curr_var = next(var for var in assignment.keys() if assignment[var] == None)
+    # Charge this node to the budget, stopping the search once it runs out
+    if (budget != None):
+        record_partial_solution(csp, assignment, budget)
+        budget.nodes += 1
+        if (budget.is_exhausted()):
+            raise SearchBudgetExceeded()
 
-    # Save a copy of the domains to revert back to
-    original_variable_domains = {k: tuple(v) for k, v in csp.variable_domains.items() if assignment[k] == None and k != curr_var}
+    # Select unassigned variable with the fewest remaining values
+    curr_var = select_unassigned_variable(csp, assignment)
+    conflict_set = set()
+    inference = bitset_forward_check if isinstance(csp, BitsetConstraintSatisfactionProblem) else forward_check
+    node_trail_mark = len(csp.trail)
 
     # Search for a valid assignment for the selected variable
-    for value in csp.variable_domains[curr_var]:
+    for value in get_ordered_values(csp, curr_var):
         # Try variable assignment
         assignment[curr_var] = value
+        trail_mark = len(csp.trail)
+        stats.values_tried += 1
 
         # Apply forward checking to reduce variable domains
-        inferences = forward_check(csp, assignment, curr_var, value, preferred_value_spacing)
+        wiped_out_var = inference(csp, assignment, curr_var, value, preferred_value_spacing, stats)
 
         # If variable assignment leads to a valid solution return the result
-        if (inferences != FAILURE):
-            result = backtrack(csp, assignment, preferred_value_spacing)
-            if (result != None):
+        if (wiped_out_var == None):
+            result = backtrack(csp, assignment, preferred_value_spacing, stats, budget)
+            if (isinstance(result, dict)):
                 return result
 
+            # Jump back past this variable if it played no part in the failure below it
+            if (curr_var not in result):
+                assignment[curr_var] = None
+                undo(csp, node_trail_mark)
+                stats.backjumps += 1
+                return result
+            value_conflict_set = result
+        else:
+            value_conflict_set = set(csp.pruned_by[wiped_out_var])
+        conflict_set |= value_conflict_set
+
         # Otherwise recover original domains to try a new variable assignment
         assignment[curr_var] = None
-        for k, v in original_variable_domains.items():
-            csp.variable_domains[k] = list(v)
+        undo(csp, trail_mark)
+        stats.backtracks += 1
+
+        # Unassigned interchangeable variables would fail on this value for the same reasons, so remove it from their
+        # domains until the search leaves this variable. This breaks the symmetry without changing the order values are tried in
+        value_conflict_set.discard(curr_var)
+        for interchangeable_var in csp.interchangeable_variables[curr_var]:
+            if (assignment[interchangeable_var] == None and remove_value(csp, interchangeable_var, value)):
+                stats.prunes += 1
+                for conflicting_var in value_conflict_set:
+                    record_pruning(csp, interchangeable_var, conflicting_var)
+
+    # Include the assignments which reduced this variable's domain before it was selected
+    conflict_set.update(csp.pruned_by[curr_var])
+    conflict_set.discard(curr_var)
+    undo(csp, node_trail_mark)
+    return conflict_set
+
+def min_conflicts_search(
+    csp: BitsetConstraintSatisfactionProblem,
+    preferred_value_spacing: int,
+    num_intervals: int,
+    budget: SearchBudget,
+    stats: SolverStats,
+    seed: int = 0
+) -> PartialSolution:
+    """Local search for large problems. Starting from a complete assignment, a random overlapping variable is repeatedly moved
+    to the value which overlaps least with the others, with ties broken by spacing, then preferred times, then at random. Once no
+    variables overlap, every variable is moved to its best value for spacing and preferred times in a few sweeps. If the budget runs
+    out first, variables are left unassigned (most overlapped first) until none overlap"""
+    rng = Random(seed)
+    variables = sorted(csp.variable_domains.keys(), key=lambda var: (var.duration, -var.num_preferred_intervals_available), reverse=True)
+    domain_values = {var: get_domain_values(csp.variable_domains[var]) for var in variables}
+    assignment = {var: None for var in csp.variable_domains}
+
+    # Number of assigned variables covering each interval, and number within the preferred spacing of one
+    occupancy = [0] * num_intervals
+    nearby = [0] * num_intervals
+
+    def move(var: TimeVariable, value: Optional[int], amount: int) -> None:
+        if (value == None):
+            return
+        last_interval = value + var.duration - 1
+        for interval in range(value, last_interval + 1):
+            occupancy[interval] += amount
+        for interval in chain(range(max(value - preferred_value_spacing, 0), value), range(last_interval + 1, min(last_interval + preferred_value_spacing + 1, num_intervals))):
+            nearby[interval] += amount
+
+    def get_overlap(var: TimeVariable, covered: list[int]) -> int:
+        """Get the number of intervals other variables share with the variable, given prefix sums of the occupancy"""
+        value = assignment[var]
+        return covered[value + var.duration] - covered[value] - var.duration
+
+    def get_best_values(var: TimeVariable) -> list[int]:
+        """Get the lowest cost values for an unassigned variable"""
+        covered = list(accumulate(occupancy, initial=0))
+        near = list(accumulate(nearby, initial=0))
+        preferred_values = csp.preferred_values[var]
+        duration = var.duration
+        costs = [
+            (covered[value + duration] - covered[value], near[value + duration] - near[value], not preferred_values >> value & 1)
+            for value in domain_values[var]
+        ]
+        stats.values_tried += len(costs)
+        lowest_cost = min(costs)
+        return [value for value, cost in zip(domain_values[var], costs) if cost == lowest_cost]
+
+    # Start from each variable at its best value given the variables before it
+    for var in variables:
+        if (len(domain_values[var]) != 0):
+            assignment[var] = get_best_values(var)[0]
+            move(var, assignment[var], 1)
 
-def schedule_daily_items(time_blocks: list[TimeBlock], daily_items: list[ScheduleItemDetails], preferred_times: list[list[TimeBlock]], preferred_spacing: int) -> list[ScheduleItem]:    
+    # Repair overlaps until none are left or the budget runs out
+    try:
+        while (True):
+            covered = list(accumulate(occupancy, initial=0))
+            overlapping_variables = [var for var in variables if assignment[var] != None and get_overlap(var, covered) > 0]
+            if (len(overlapping_variables) == 0):
+                break
+
+            budget.nodes += 1
+            stats.nodes += 1
+            if (budget.is_exhausted()):
+                raise SearchBudgetExceeded()
+
+            # Move a random overlapping variable, occasionally to a random value to escape plateaus
+            var = rng.choice(overlapping_variables)
+            move(var, assignment[var], -1)
+            if (rng.random() < MIN_CONFLICTS_RANDOM_WALK_PROBABILITY):
+                assignment[var] = rng.choice(domain_values[var])
+            else:
+                assignment[var] = rng.choice(get_best_values(var))
+            move(var, assignment[var], 1)
+
+        # Improve spacing and preferred time hits without introducing overlaps, keeping the current value on ties
+        for _ in range(MIN_CONFLICTS_IMPROVEMENT_SWEEPS):
+            improved = False
+            for var in variables:
+                if (assignment[var] == None):
+                    continue
+
+                budget.nodes += 1
+                stats.nodes += 1
+                if (budget.is_exhausted()):
+                    raise SearchBudgetExceeded()
+
+                move(var, assignment[var], -1)
+                best_values = get_best_values(var)
+                if (assignment[var] not in best_values):
+                    assignment[var] = best_values[0]
+                    improved = True
+                move(var, assignment[var], 1)
+
+            if (not improved):
+                break
+    except SearchBudgetExceeded:
+        pass
+
+    # Leave out overlapping variables, most overlapped first
+    while (True):
+        covered = list(accumulate(occupancy, initial=0))
+        overlaps = [(get_overlap(var, covered), var) for var in variables if assignment[var] != None]
+        overlap, var = max(overlaps, key=lambda overlap: overlap[0], default=(0, None))
+        if (overlap == 0):
+            return assignment
+        move(var, assignment[var], -1)
+        assignment[var] = None
+
+def create_csp(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    num_intervals: int,
+    seconds_per_interval: int
+) -> ConstraintSatisfactionProblem:
     # Initialize starting domain
-    seconds_per_interval = 60 * 15
-    num_intervals = floor(86400 / seconds_per_interval)
     domain = range(num_intervals)
     start_intervals = []
     for time_block in time_blocks:
         # Get interval numbers that overlap with the time block
-        first_interval = floor(time_block[0] / seconds_per_interval)
-        result = time_block[1] / seconds_per_interval
-        last_interval = result - 1 if result.is_integer() else floor(result)
-        interval_numbers = range(first_interval, int(last_interval) + 1)
+        first_interval, last_interval = get_interval_range(time_block, seconds_per_interval)
+        interval_numbers = range(first_interval, last_interval + 1)
 
         # Reduce domain
         domain = tuple(x for x in domain if x not in interval_numbers)
@@ -126,144 +605,420 @@ def schedule_daily_items(time_blocks: list[TimeBlock], daily_items: list[Schedul
         start_intervals.append(first_interval)
 
     # Create time variables
-    time_variables = tuple(TimeVariable(name, ceil(duration / seconds_per_interval), schedule_item_type) for name, duration, schedule_item_type in daily_items)
+    time_variables = tuple(TimeVariable(name, ceil(duration / seconds_per_interval), schedule_item_type) for name, duration, schedule_item_type in items)
 
-    # Determine domain for each variable
+    # Determine domain and value priorities for each variable
     variable_domains = {}
+    preferred_values = {}
+    value_priorities = {}
     for i, time_variable in enumerate(time_variables):
         # Reduce domain to viable values
         variable_domains[time_variable] = [x for x in domain if x not in range(num_intervals - time_variable.duration + 1, num_intervals)]
         for start_interval in start_intervals:
             variable_domains[time_variable] = [x for x in variable_domains[time_variable] if x not in range(start_interval - time_variable.duration + 1, start_interval)]
 
-        # Prioritize values
+        # Prioritize values, with later preferred time intervals placed ahead of earlier ones
+        domain_values = set(variable_domains[time_variable])
+        priorities = list(range(num_intervals))
+        next_preferred_priority = -1
+        preferred_values[time_variable] = 0
         for preferred_time_interval in preferred_times[i]:
-            first_preferred_interval = floor(preferred_time_interval[0] / seconds_per_interval)
-            result = preferred_time_interval[1] / seconds_per_interval
-            last_preferred_interval = result - 1 if result.is_integer() else floor(result)
-            for interval in range(int(last_preferred_interval), first_preferred_interval - 1, -1):
-                try:
-                    variable_domains[time_variable].remove(interval)
-                    variable_domains[time_variable].insert(0, interval)
+            first_preferred_interval, last_preferred_interval = get_interval_range(preferred_time_interval, seconds_per_interval)
+            for interval in range(last_preferred_interval, first_preferred_interval - 1, -1):
+                if (interval in domain_values):
+                    priorities[interval] = next_preferred_priority
+                    next_preferred_priority -= 1
                     time_variable.num_preferred_intervals_available += 1
-                except ValueError:
-                    pass
+                    preferred_values[time_variable] |= 1 << interval
+        value_priorities[time_variable] = priorities
 
-    # Solve constraint satisfaction problem to produce a schedule for the given daily items
-    csp = ConstraintSatisfactionProblem(variable_domains, [])
-    preferred_value_spacing = ceil(preferred_spacing / seconds_per_interval)
-    solution = backtracking_search(csp, preferred_value_spacing)
-    if (solution != None):
-        return [ScheduleItem(
-            name=time_variable.name,
-            start_time=seconds_to_time_object(start_interval * seconds_per_interval),
-            end_time=seconds_to_time_object((start_interval + time_variable.duration) * seconds_per_interval),
-            schedule_item_type=time_variable.schedule_item_type,
-        ) for time_variable, start_interval in solution.items()]
-    else:
-        raise ClientException(detail="Could not find time slots for daily items", status_code=HTTP_409_CONFLICT)
+    interchangeable_variables = get_interchangeable_variables(time_variables, items, preferred_times)
+    return ConstraintSatisfactionProblem(variable_domains, interchangeable_variables, preferred_values, value_priorities, num_intervals, [])
 
-def schedule_weekly_items(time_blocks: list[TimeBlock], weekly_items: list[ScheduleItemDetails], preferred_times: list[list[TimeBlock]], preferred_spacing: int) -> list[list[ScheduleItem]]:
+def create_bitset_csp(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    num_intervals: int,
+    seconds_per_interval: int
+) -> BitsetConstraintSatisfactionProblem:
     # Initialize starting domain
-    seconds_per_interval = 60 * 15
-    num_intervals = floor(SECONDS_PER_DAY * DAYS_PER_WEEK / seconds_per_interval)
-    domain = range(num_intervals)
+    domain = get_interval_mask(0, num_intervals - 1)
     start_intervals = []
     for time_block in time_blocks:
-        # Get interval numbers that overlap with the time block
-        first_interval = floor(time_block[0] / seconds_per_interval)
-        result = time_block[1] / seconds_per_interval
-        last_interval = result - 1 if result.is_integer() else floor(result)
-        interval_numbers = range(first_interval, int(last_interval) + 1)
-
-        # Reduce domain
-        domain = tuple(x for x in domain if x not in interval_numbers)
+        # Remove interval numbers that overlap with the time block
+        first_interval, last_interval = get_interval_range(time_block, seconds_per_interval)
+        domain &= ~get_interval_mask(first_interval, last_interval)
 
         # Track start intervals for variable specific domain reductions
         start_intervals.append(first_interval)
 
     # Create time variables
-    time_variables = tuple(TimeVariable(name, ceil(duration / seconds_per_interval), schedule_item_type) for name, duration, schedule_item_type in weekly_items)
+    time_variables = tuple(TimeVariable(name, ceil(duration / seconds_per_interval), schedule_item_type) for name, duration, schedule_item_type in items)
 
-    # Determine domain for each variable
+    # Determine domain and value priorities for each variable
     variable_domains = {}
+    preferred_values = {}
+    value_priorities = {}
     for i, time_variable in enumerate(time_variables):
-        # Reduce domain to viable values
-        variable_domains[time_variable] = [x for x in domain if x not in range(num_intervals - time_variable.duration + 1, num_intervals)]
+        # Reduce domain to start intervals where the variable fits
+        variable_domain = domain & ~get_interval_mask(num_intervals - time_variable.duration + 1, num_intervals - 1)
         for start_interval in start_intervals:
-            variable_domains[time_variable] = [x for x in variable_domains[time_variable] if x not in range(start_interval - time_variable.duration + 1, start_interval)]
+            variable_domain &= ~get_interval_mask(start_interval - time_variable.duration + 1, start_interval - 1)
+        variable_domains[time_variable] = variable_domain
 
-        # Prioritize values
+        # Prioritize values, with later preferred time intervals placed ahead of earlier ones
+        priorities = list(range(num_intervals))
+        next_preferred_priority = -1
+        preferred_values[time_variable] = 0
         for preferred_time_interval in preferred_times[i]:
-            first_preferred_interval = floor(preferred_time_interval[0] / seconds_per_interval)
-            result = preferred_time_interval[1] / seconds_per_interval
-            last_preferred_interval = result - 1 if result.is_integer() else floor(result)
-            for interval in range(int(last_preferred_interval), first_preferred_interval - 1, -1):
-                try:
-                    variable_domains[time_variable].remove(interval)
-                    variable_domains[time_variable].insert(0, interval)
+            first_preferred_interval, last_preferred_interval = get_interval_range(preferred_time_interval, seconds_per_interval)
+            for interval in range(last_preferred_interval, max(first_preferred_interval, 0) - 1, -1):
+                if (variable_domain >> interval & 1):
+                    priorities[interval] = next_preferred_priority
+                    next_preferred_priority -= 1
                     time_variable.num_preferred_intervals_available += 1
-                except ValueError:
-                    pass
+                    preferred_values[time_variable] |= 1 << interval
+        value_priorities[time_variable] = priorities
 
-    # Solve constraint satisfaction problem to produce a schedule for the given weekly items
-    csp = ConstraintSatisfactionProblem(variable_domains, [])
+    interchangeable_variables = get_interchangeable_variables(time_variables, items, preferred_times)
+    return BitsetConstraintSatisfactionProblem(variable_domains, interchangeable_variables, preferred_values, value_priorities, num_intervals, [])
+
+def solve(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    seconds_per_interval: int,
+    engine: str,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    stats: Optional[SolverStats] = None
+) -> Optional[PartialSolution]:
+    stats = SolverStats() if stats == None else stats
+    stats.solves += 1
+    stats.searches += 1
+
+    # Create constraint satisfaction problem
+    start = perf_counter()
     preferred_value_spacing = ceil(preferred_spacing / seconds_per_interval)
-    solution = backtracking_search(csp, preferred_value_spacing)
-    if (solution != None):
-        schedule_items = [[] for _ in range(DAYS_PER_WEEK)]
-        for time_variable, start_interval in solution.items():
-            # Second offset of schedule item from start of the first day
-            start = start_interval * seconds_per_interval
-            end = (start_interval + time_variable.duration) * seconds_per_interval
-
-            # Start and end days of the schedule item
-            start_day = floor(start / SECONDS_PER_DAY)
-            end_day = floor(end / SECONDS_PER_DAY)
-
-            # Second offset of the schedule item from its respective start and end days
-            start_day_offset = start % SECONDS_PER_DAY
-            end_day_offset = end % SECONDS_PER_DAY
-
-            # Schedule item is contained within a single day
-            if (start_day == end_day):
-                schedule_items[start_day].append(ScheduleItem(
-                    name=time_variable.name,
-                    start_time=seconds_to_time_object(start_day_offset),
-                    end_time=seconds_to_time_object(end_day_offset),
-                    schedule_item_type=time_variable.schedule_item_type
-                ))
-
-            # Schedule item occurs over multiple days
-            elif (start_day < end_day):
-                # First day
-                schedule_items[start_day].append(ScheduleItem(
-                    name=time_variable.name,
-                    start_time=seconds_to_time_object(start_offset),
-                    end_time=seconds_to_time_object(SECONDS_PER_DAY),
-                    schedule_item_type=time_variable.schedule_item_type
-                ))
-
-                # Middle days
-                day = start_day + 1
-                while (day < end_day):
-                    schedule_items[day].append(ScheduleItem(
-                        name=time_variable.name,
-                        start_time=time(),
-                        end_time=seconds_to_time_object(SECONDS_PER_DAY),
-                        schedule_item_type=time_variable.schedule_item_type
-                    ))
-                    day += 1
-
-                # Last day
-                if (end_offset != 0):
-                    schedule_items[end_day].append(ScheduleItem(
-                        name=time_variable.name,
-                        start_time=time(),
-                        end_time=seconds_to_time_object(end_offset),
-                        schedule_item_type=time_variable.schedule_item_type
-                    ))
-
-        return schedule_items
+    if (engine == LIST_ENGINE):
+        csp = create_csp(time_blocks, items, preferred_times, num_intervals, seconds_per_interval)
+    else:
+        csp = create_bitset_csp(time_blocks, items, preferred_times, num_intervals, seconds_per_interval)
+    stats.add_timing("build", perf_counter() - start)
+
+    start = perf_counter()
+    if (engine == MIN_CONFLICTS_ENGINE):
+        # Local search always needs a budget to stop it
+        stats.local_searches += 1
+        budget = SearchBudget(MIN_CONFLICTS_MAX_STEPS if (max_nodes == None and time_limit == None) else max_nodes, time_limit)
+        solution = min_conflicts_search(csp, preferred_value_spacing, num_intervals, budget, stats)
     else:
-        raise ClientException(detail="Could not find time slots for weekly items", status_code=HTTP_409_CONFLICT)
\ No newline at end of file
+        # Only track partial solutions when the search is limited
+        budget = None if (max_nodes == None and time_limit == None) else SearchBudget(max_nodes, time_limit)
+        solution = backtracking_search(csp, preferred_value_spacing, budget, stats)
+    stats.add_timing("search", perf_counter() - start)
+
+    # Return the solution in the order the items were given
+    return None if (solution == None) else {time_variable: solution[time_variable] for time_variable in csp.variable_domains}
+
+def get_free_intervals(time_blocks: list[TimeBlock], num_intervals: int, seconds_per_interval: int) -> BitsetDomain:
+    """Get a bitmask of the intervals not covered by any time block"""
+    free_intervals = get_interval_mask(0, num_intervals - 1)
+    for time_block in time_blocks:
+        free_intervals &= ~get_interval_mask(*get_interval_range(time_block, seconds_per_interval))
+    return free_intervals
+
+def get_fitting_start_intervals(free_intervals: BitsetDomain, duration: int) -> BitsetDomain:
+    """Get a bitmask of the start intervals from which the given number of consecutive intervals are all free"""
+    start_intervals = free_intervals
+    run_length = 1
+    while (run_length < duration):
+        # Each set bit marks the start of a free run of run_length intervals, so combining it with the bit shift intervals
+        # later extends the run by shift intervals
+        shift = min(run_length, duration - run_length)
+        start_intervals &= start_intervals >> shift
+        run_length += shift
+    return start_intervals
+
+def greedy_solve(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    seconds_per_interval: int
+) -> Optional[StartIntervals]:
+    """Place the items one at a time, longest first, at the earliest start interval where they fit. Like the search, start
+    intervals away from placed items by the preferred spacing are tried first, and within those, start intervals at preferred
+    times. Returns None as soon as an item cannot be placed, in which case the problem should be searched instead"""
+    preferred_value_spacing = ceil(preferred_spacing / seconds_per_interval)
+    durations = [ceil(duration / seconds_per_interval) for _, duration, _ in items]
+    free_intervals = get_free_intervals(time_blocks, num_intervals, seconds_per_interval)
+    spaced_free_intervals = free_intervals
+
+    start_intervals = [None] * len(items)
+    for i in sorted(range(len(items)), key=lambda i: durations[i], reverse=True):
+        preferred_start_intervals = 0
+        for preferred_time_interval in preferred_times[i]:
+            preferred_start_intervals |= get_interval_mask(*get_interval_range(preferred_time_interval, seconds_per_interval))
+
+        # Pick the earliest start interval from the most preferred group which has any
+        fitting_start_intervals = get_fitting_start_intervals(free_intervals, durations[i])
+        spaced_start_intervals = get_fitting_start_intervals(spaced_free_intervals, durations[i])
+        candidate_groups = (spaced_start_intervals & preferred_start_intervals, spaced_start_intervals, fitting_start_intervals & preferred_start_intervals, fitting_start_intervals)
+        candidates = next((candidates for candidates in candidate_groups if candidates != 0), 0)
+        if (candidates == 0):
+            return None
+        start_interval = (candidates & -candidates).bit_length() - 1
+        start_intervals[i] = start_interval
+
+        # Occupy the chosen intervals, keeping the preferred spacing clear around them for later items where possible
+        last_interval = start_interval + durations[i] - 1
+        free_intervals &= ~get_interval_mask(start_interval, last_interval)
+        spaced_free_intervals &= ~get_interval_mask(start_interval - preferred_value_spacing, last_interval + preferred_value_spacing)
+
+    return start_intervals
+
+def solve_start_intervals(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    seconds_per_interval: int,
+    engine: str,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    greedy: bool = False
+) -> tuple[Optional[StartIntervals], SolverStats]:
+    """Version of solve which only takes and returns plain data, so that it can be run in the solver executor. With greedy set,
+    a greedy placement is tried first and the search only runs if it fails"""
+    stats = SolverStats()
+    if (greedy):
+        start = perf_counter()
+        start_intervals = greedy_solve(time_blocks, items, preferred_times, preferred_spacing, num_intervals, seconds_per_interval)
+        stats.add_timing("greedy", perf_counter() - start)
+        if (start_intervals != None):
+            stats.solves += 1
+            stats.greedy_solves += 1
+            return start_intervals, stats
+
+    # Backtracking rarely finishes on large problems in time, so use local search instead
+    if (len(items) >= LOCAL_SEARCH_MIN_ITEMS):
+        engine = MIN_CONFLICTS_ENGINE
+
+    solution = solve(time_blocks, items, preferred_times, preferred_spacing, num_intervals, seconds_per_interval, engine, max_nodes, time_limit, stats)
+    return None if (solution == None) else list(solution.values()), stats
+
+def get_problem_fingerprint(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    seconds_per_interval: int,
+    engine: str,
+    greedy: bool
+) -> str:
+    """Hash the problem in a canonical form. Occupied time blocks are reduced to the intervals they cover and item names to the
+    order they first appear in, so problems which only differ in ways the solver cannot see share a fingerprint"""
+    name_ids = {}
+    canonical_problem = (
+        engine,
+        greedy,
+        num_intervals,
+        seconds_per_interval,
+        ceil(preferred_spacing / seconds_per_interval),
+        sorted(set(get_interval_range(time_block, seconds_per_interval) for time_block in time_blocks)),
+        [(name_ids.setdefault(name, len(name_ids)), duration, schedule_item_type.value) for name, duration, schedule_item_type in items],
+        preferred_times
+    )
+    return sha256(repr(canonical_problem).encode()).hexdigest()
+
+async def find_start_intervals(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_intervals: int,
+    seconds_per_interval: int,
+    engine: str,
+    max_nodes: Optional[int],
+    time_limit: Optional[float],
+    greedy: bool,
+    solution_cache: Optional[TieredCache]
+) -> tuple[Optional[StartIntervals], SolverStats]:
+    """Get the start intervals for the items from the solution cache, or solve for them in the solver executor"""
+    # Look up previous result for the same problem
+    fingerprint = None
+    if (solution_cache != None):
+        start = perf_counter()
+        fingerprint = get_problem_fingerprint(time_blocks, items, preferred_times, preferred_spacing, num_intervals, seconds_per_interval, engine, greedy)
+        cached_start_intervals = await solution_cache.get(fingerprint)
+        if (cached_start_intervals != None):
+            stats = SolverStats()
+            stats.cache_hits += 1
+            stats.add_timing("cache", perf_counter() - start)
+            return json.loads(cached_start_intervals), stats
+
+    # Solve constraint satisfaction problem, timing the round trip to the solver executor separately from the solve itself
+    start = perf_counter()
+    start_intervals, stats = await run_in_solver_executor(
+        solve_start_intervals, time_blocks, items, preferred_times, preferred_spacing, num_intervals, seconds_per_interval, engine, max_nodes, time_limit, greedy
+    )
+    stats.add_timing("executor", perf_counter() - start)
+
+    # Cache complete solutions and proven infeasibility, but not partial solutions from a search which ran out of budget
+    if (fingerprint != None and (start_intervals == None or None not in start_intervals)):
+        await solution_cache.set(fingerprint, json.dumps(start_intervals))
+
+    return start_intervals, stats
+
+def get_free_runs(time_blocks: list[TimeBlock], num_intervals: int, seconds_per_interval: int) -> list[int]:
+    """Get the lengths of the runs of consecutive intervals not covered by any time block"""
+    free_intervals = get_free_intervals(time_blocks, num_intervals, seconds_per_interval)
+    free_runs = []
+    while (free_intervals != 0):
+        # Skip to the start of the next run, then measure its length by the number of trailing ones
+        free_intervals >>= (free_intervals & -free_intervals).bit_length() - 1
+        run_length = (free_intervals ^ (free_intervals + 1)).bit_length() - 1
+        free_runs.append(run_length)
+        free_intervals >>= run_length
+    return free_runs
+
+def find_unfittable_items(time_blocks: list[TimeBlock], items: list[ScheduleItemDetails], num_intervals: int, seconds_per_interval: int) -> list[ScheduleItemDetails]:
+    """Check necessary conditions for the items to fit around the time blocks, without searching. Returns the items longer than
+    every free run, or failing that the shortest list of the longest items which cannot all fit together. An empty list does not
+    guarantee a solution exists"""
+    free_runs = get_free_runs(time_blocks, num_intervals, seconds_per_interval)
+    durations = [ceil(duration / seconds_per_interval) for _, duration, _ in items]
+
+    # Items which fit in no free run
+    longest_run = max(free_runs, default=0)
+    unfittable_items = [item for item, duration in zip(items, durations) if duration > longest_run]
+    if (len(unfittable_items) != 0):
+        return unfittable_items
+
+    # Items at least a given length can only go in runs at least that long, which have limited capacity and can each hold a
+    # limited number of them
+    for min_duration in sorted(set(durations), reverse=True):
+        long_durations = [duration for duration in durations if duration >= min_duration]
+        usable_runs = [run_length for run_length in free_runs if run_length >= min_duration]
+        if (sum(long_durations) > sum(usable_runs) or len(long_durations) > sum(run_length // min_duration for run_length in usable_runs)):
+            return [item for item, duration in zip(items, durations) if duration >= min_duration]
+    return []
+
+def check_items_fit(time_blocks: list[TimeBlock], items: list[ScheduleItemDetails], num_intervals: int, seconds_per_interval: int, description: str) -> None:
+    """Raise a conflict naming the items which cannot fit, before any search is run"""
+    unfittable_items = find_unfittable_items(time_blocks, items, num_intervals, seconds_per_interval)
+    if (len(unfittable_items) != 0):
+        increment("solver_precheck_failures")
+        names = ", ".join(dict.fromkeys(name for name, _, _ in unfittable_items))
+        raise ClientException(detail=f"Could not find time slots for {description}, not enough free time for: {names}", status_code=HTTP_409_CONFLICT)
+
+def get_unplaced_items(items: list[ScheduleItemDetails], start_intervals: StartIntervals) -> list[ScheduleItemDetails]:
+    return [item for item, start_interval in zip(items, start_intervals) if start_interval == None]
+
+def split_into_days(name: str, schedule_item_type: ScheduleItemTypeEnum, start: int, end: int) -> Generator[tuple[int, ScheduleItem], None, None]:
+    """Split the time from start to end (in seconds from the start of the first day) into a schedule item for each day it covers"""
+    day = floor(start / SECONDS_PER_DAY)
+    while (day * SECONDS_PER_DAY < end):
+        # Second offsets of the part of the item falling on this day
+        day_start = max(start - day * SECONDS_PER_DAY, 0)
+        day_end = min(end - day * SECONDS_PER_DAY, SECONDS_PER_DAY)
+        yield day, ScheduleItem(
+            name=name,
+            start_time=seconds_to_time_object(day_start),
+            end_time=seconds_to_time_object(day_end),
+            schedule_item_type=schedule_item_type
+        )
+        day += 1
+
+async def schedule_items_over_horizon(
+    time_blocks: list[TimeBlock],
+    items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    num_days: int,
+    seconds_per_interval: int = SECONDS_PER_INTERVAL,
+    engine: str = BITSET_ENGINE,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    greedy: bool = False,
+    solution_cache: Optional[TieredCache] = None,
+    description: str = "items"
+) -> tuple[list[list[ScheduleItem]], list[ScheduleItemDetails]]:
+    """Schedule the items over a number of consecutive days, with time blocks and preferred times given in seconds from the start
+    of the first day. Returns the schedule items created for each day, with items crossing midnight split between the days they
+    cover, along with any items left unplaced because the search budget ran out"""
+    if (SECONDS_PER_DAY % seconds_per_interval != 0):
+        raise ValueError(f"Slot size of {seconds_per_interval} seconds does not divide a day")
+    num_intervals = num_days * SECONDS_PER_DAY // seconds_per_interval
+
+    # Fail fast on items which clearly cannot fit
+    check_items_fit(time_blocks, items, num_intervals, seconds_per_interval, description)
+
+    # Solve constraint satisfaction problem to produce a schedule for the given items
+    start_intervals, stats = await find_start_intervals(
+        time_blocks, items, preferred_times, preferred_spacing, num_intervals, seconds_per_interval, engine, max_nodes, time_limit, greedy, solution_cache
+    )
+    if (start_intervals == None):
+        record_solver_stats(stats)
+        raise ClientException(detail=f"Could not find time slots for {description}", status_code=HTTP_409_CONFLICT)
+
+    # Create schedule items for each day
+    start = perf_counter()
+    schedule_items = [[] for _ in range(num_days)]
+    for (name, duration, schedule_item_type), start_interval in zip(items, start_intervals):
+        # Skip items which were left unplaced
+        if (start_interval == None):
+            continue
+
+        item_start = start_interval * seconds_per_interval
+        item_end = (start_interval + ceil(duration / seconds_per_interval)) * seconds_per_interval
+        for day, schedule_item in split_into_days(name, schedule_item_type, item_start, item_end):
+            schedule_items[day].append(schedule_item)
+    stats.add_timing("convert", perf_counter() - start)
+    record_solver_stats(stats)
+
+    return schedule_items, get_unplaced_items(items, start_intervals)
+
+async def schedule_daily_items(
+    time_blocks: list[TimeBlock],
+    daily_items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    seconds_per_interval: int = SECONDS_PER_INTERVAL,
+    engine: str = BITSET_ENGINE,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    greedy: bool = False,
+    solution_cache: Optional[TieredCache] = None
+) -> tuple[list[ScheduleItem], list[ScheduleItemDetails]]:
+    """Schedule the daily items, returning the schedule items created along with any items left unplaced because the search
+    budget ran out"""
+    schedule_items, unplaced_items = await schedule_items_over_horizon(
+        time_blocks, daily_items, preferred_times, preferred_spacing, 1, seconds_per_interval, engine, max_nodes, time_limit, greedy, solution_cache, "daily items"
+    )
+    return schedule_items[0], unplaced_items
+
+async def schedule_weekly_items(
+    time_blocks: list[TimeBlock],
+    weekly_items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int,
+    seconds_per_interval: int = SECONDS_PER_INTERVAL,
+    engine: str = BITSET_ENGINE,
+    max_nodes: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    greedy: bool = False,
+    solution_cache: Optional[TieredCache] = None
+) -> tuple[list[list[ScheduleItem]], list[ScheduleItemDetails]]:
+    """Schedule the weekly items, returning the schedule items created for each day along with any items left unplaced because
+    the search budget ran out"""
+    return await schedule_items_over_horizon(
+        time_blocks, weekly_items, preferred_times, preferred_spacing, DAYS_PER_WEEK, seconds_per_interval, engine, max_nodes, time_limit, greedy, solution_cache, "weekly items"
+    )
@@ -1,7 +1,12 @@
 from models.event import Event
 from models.updated_event_instance import UpdatedEventInstance
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional, Generator
 from pytz import timezone
+from lib.time import DateRange, get_local_date_range
+
+# Number of months between instances of calendar based repeat rules
+REPEAT_RULE_MONTHS = {"MONTHLY": 1, "YEARLY": 12}
 
 def get_updated_event_instance_from_event(event: Event, start_time: datetime) -> UpdatedEventInstance:
     return UpdatedEventInstance(
@@ -23,4 +28,50 @@ def get_event_from_updated_event_instance(updated_instance: UpdatedEventInstance
         repeat_rule=updated_instance.event.repeat_rule,
         description=updated_instance.description,
         location=updated_instance.location
-    )
\ No newline at end of file
+    )
+
+def get_event_date_range(event: Event) -> DateRange:
+    """Get the range of dates the instances of an event can fall on. Events repeating forever have an open ended range"""
+    if (event.repeat_rule == "NEVER"):
+        return get_local_date_range(event.start_time, event.end_time)
+    if (event.until == None):
+        return (get_local_date_range(event.start_time, event.end_time)[0], None)
+    return get_local_date_range(event.start_time, event.until + (event.end_time - event.start_time))
+
+def add_months(dt: datetime, months: int) -> Optional[datetime]:
+    """Shift a datetime by a number of months. Returns None if the day does not exist in the resulting month"""
+    month_index = dt.month - 1 + months
+    try:
+        return dt.replace(year=dt.year + month_index // 12, month=month_index % 12 + 1)
+    except ValueError:
+        return None
+
+def get_calendar_instance_start_times(
+    event_start_time: datetime,
+    event_duration: timedelta,
+    until: Optional[datetime],
+    repeat_months: int,
+    range_start: datetime,
+    range_end: datetime
+) -> Generator[datetime, None, None]:
+    """Yield the start times of a monthly or yearly event's instances which intersect the given range, up to and including an
+    instance starting at the until value. Instances falling on a day that does not exist in their month (e.g. the 31st of April)
+    are skipped"""
+    # Instances in months before the earliest possible start cannot reach the range, so jump straight past them
+    earliest_start_time = range_start - event_duration
+    months_to_range = (earliest_start_time.year - event_start_time.year) * 12 + (earliest_start_time.month - event_start_time.month)
+    instance_number = max(-(-months_to_range // repeat_months), 0)
+
+    while True:
+        instance_start_time = add_months(event_start_time, instance_number * repeat_months)
+        instance_number += 1
+
+        # Skip invalid days
+        if (instance_start_time == None):
+            continue
+
+        if (instance_start_time >= range_end or (until != None and instance_start_time > until)):
+            return
+
+        if (instance_start_time + event_duration > range_start):
+            yield instance_start_time
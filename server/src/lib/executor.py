@@ -0,0 +1,38 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+# Process pool used to keep CPU-bound solving off the event loop. Work submitted to it must only take and return plain
+# data (no ORM objects), since arguments and results are pickled between processes
+solver_executor: Optional[ProcessPoolExecutor] = None
+
+def warm_up_solver_process() -> None:
+    pass
+
+async def start_solver_executor(max_workers: int) -> None:
+    """Start the pool and its processes. Processes are started from a forkserver rather than forked from the server, since the
+    server has threads (e.g. database and Valkey clients) whose state forked children could inherit mid-operation. Every process
+    is started straight away so that requests do not pay for it"""
+    global solver_executor
+    mp_context = multiprocessing.get_context("forkserver")
+    mp_context.set_forkserver_preload(["lib.constraint"])
+    solver_executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+    # Processes are only started as work is submitted, so submit enough work to start all of them
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(solver_executor, warm_up_solver_process) for _ in range(max_workers)))
+
+def shutdown_solver_executor() -> None:
+    """Stop the pool without blocking the event loop while running solves finish"""
+    global solver_executor
+    if (solver_executor != None):
+        solver_executor.shutdown(wait=False, cancel_futures=True)
+        solver_executor = None
+
+async def run_in_solver_executor[T](fn: Callable[..., T], *args) -> T:
+    """Run a function in the solver process pool and wait for its result. When the pool has not been started (e.g. in scripts)
+    the function runs directly in the calling thread"""
+    if (solver_executor == None):
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(solver_executor, fn, *args)
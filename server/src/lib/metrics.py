@@ -0,0 +1,18 @@
+from collections import Counter
+from typing import Callable
+
+# Metrics are collected per worker process
+counters: Counter[str] = Counter()
+providers: dict[str, Callable[[], dict]] = {}
+
+def increment(name: str, amount: int = 1) -> None:
+    counters[name] += amount
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """Register a callable which reports a group of metrics under the given name"""
+    providers[name] = provider
+
+def collect() -> dict:
+    metrics = {name: provider() for name, provider in providers.items()}
+    metrics["counters"] = dict(counters)
+    return metrics
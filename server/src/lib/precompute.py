@@ -0,0 +1,110 @@
+from models.user import User
+from domain.users.schedules.repositories import ScheduleRepository
+from domain.users.preferences.repositories import PreferenceRepository
+from domain.users.events.repositories import EventRepository
+from domain.users.habits.repositories import HabitRepository
+from lib.schedule import requires_refresh, get_week_start, lock_week, ScheduleBuilder, ScheduleDirector
+from lib.refresh_queue import schedule_refresh_queue
+from lib.cache import TieredCache
+from lib.metrics import increment
+from middleware.auth import valkey_store
+from config.plugins import session_maker
+from config.settings import USER_CACHE_SIZE, SCHEDULE_PRECOMPUTE, SCHEDULE_PRECOMPUTE_DAYS
+from litestar import Litestar
+from litestar.exceptions import ClientException
+from redis.exceptions import RedisError
+from datetime import date, timedelta
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+from uuid import UUID
+import asyncio
+import logging
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Timezones users last fetched their schedules in, since background refreshes have no request to take one from. These are
+# always kept in Valkey, since the worker which handles a user's change is often not the one which served their reads
+SCHEDULE_TIMEZONE_TTL = 30 * 86400
+schedule_timezones = TieredCache(USER_CACHE_SIZE, SCHEDULE_TIMEZONE_TTL, valkey_store.with_namespace("schedule_timezones"))
+
+# Seconds to wait for a job before checking the queue again
+QUEUE_POLL_TIMEOUT = 5
+
+async def remember_schedule_timezone(user_id: UUID, timezone_name: str) -> None:
+    if (SCHEDULE_PRECOMPUTE and await schedule_timezones.get(str(user_id)) != timezone_name):
+        await schedule_timezones.set(str(user_id), timezone_name)
+
+async def refresh_schedules(user_id: UUID, start_date: date) -> None:
+    """Refresh the user's out of date schedules over the days following the start date, so that they are ready before the
+    user next reads them"""
+    # Schedules can only be generated once the user's timezone is known
+    timezone_name = await schedule_timezones.get(str(user_id))
+    if (timezone_name == None):
+        increment("schedule_precompute_skipped")
+        return
+
+    async with session_maker() as session:
+        user = await session.get(User, user_id)
+        if (user == None):
+            return
+
+        # Find out of date schedules
+        schedules_repo = ScheduleRepository(session=session)
+        end_date = start_date + timedelta(days=SCHEDULE_PRECOMPUTE_DAYS - 1)
+        schedule_dates = [schedule.date for schedule in await schedules_repo.get_schedules_in_range(user.id, start_date, end_date) if requires_refresh(schedule)]
+
+        # Refresh each day, saving it straight away. Days which cannot be scheduled are left for the next read to report
+        for schedule_date in schedule_dates:
+            async with lock_week(user.id, get_week_start(schedule_date)):
+                # Skip days which have been refreshed by a read in the meantime
+                schedule = (await schedules_repo.get_schedules_in_range(user.id, schedule_date, schedule_date, reload=True))[0]
+                if (not requires_refresh(schedule)):
+                    continue
+
+                try:
+                    await ScheduleDirector().generate_schedule(
+                        ScheduleBuilder(schedule),
+                        user,
+                        PreferenceRepository(session=session),
+                        EventRepository(session=session),
+                        HabitRepository(session=session),
+                        pytz.timezone(timezone_name)
+                    )
+                except ClientException:
+                    # Discard the day's partial changes so that they are not saved with the next day, and reload the user
+                    # which the rollback expired
+                    await session.rollback()
+                    await session.refresh(user)
+                    increment("schedule_precompute_failures")
+                    continue
+
+                await schedules_repo.save_schedules([])
+                increment("schedule_precompute_refreshes")
+
+async def process_schedule_refresh_queue() -> None:
+    while True:
+        # Wait for the next job
+        try:
+            job = await schedule_refresh_queue.pop(QUEUE_POLL_TIMEOUT)
+        except RedisError:
+            await asyncio.sleep(1)
+            continue
+        if (job == None):
+            continue
+
+        # Keep the worker alive if a refresh fails
+        try:
+            await refresh_schedules(*job)
+        except Exception:
+            increment("schedule_precompute_errors")
+            logger.exception("Background schedule refresh failed for user %s", job[0])
+
+@asynccontextmanager
+async def schedule_precompute_lifespan(_: Litestar) -> AsyncGenerator[None, None]:
+    worker = asyncio.create_task(process_schedule_refresh_queue()) if SCHEDULE_PRECOMPUTE else None
+    try:
+        yield
+    finally:
+        if (worker != None):
+            worker.cancel()
@@ -0,0 +1,82 @@
+from redis.asyncio import Redis
+from middleware.auth import valkey_client
+from config.settings import SCHEDULE_PRECOMPUTE_SHARED
+from datetime import date
+from typing import Optional
+from uuid import UUID
+import asyncio
+
+# Adds a user to the queue, or moves their pending start date earlier if they are already queued
+PUSH_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+elseif ARGV[2] < current then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+# Takes a dequeued user's pending start date, so that later jobs for the user queue them again
+TAKE_SCRIPT = """
+local start_date = redis.call('HGET', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+return start_date
+"""
+
+class InMemoryRefreshQueue:
+    """Queue of users whose schedules need refreshing from a date onwards. Each user is queued at most once, with the
+    earliest date from all of their pending jobs"""
+    pending: dict[UUID, date]
+
+    def __init__(self) -> None:
+        self.pending = {}
+        self._users: asyncio.Queue[UUID] = asyncio.Queue()
+
+    async def push(self, user_id: UUID, start_date: date) -> None:
+        if (user_id in self.pending):
+            self.pending[user_id] = min(self.pending[user_id], start_date)
+        else:
+            self.pending[user_id] = start_date
+            self._users.put_nowait(user_id)
+
+    async def pop(self, timeout: float) -> Optional[tuple[UUID, date]]:
+        """Wait for the next job, returning None if there is none within the timeout"""
+        try:
+            user_id = await asyncio.wait_for(self._users.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return user_id, self.pending.pop(user_id)
+
+class ValkeyRefreshQueue:
+    """Refresh queue kept in Valkey so that jobs are shared between workers. Pending start dates are kept in a hash beside
+    a list of queued users"""
+    client: Redis
+    dates_key: str
+    users_key: str
+
+    def __init__(self, client: Redis, name: str) -> None:
+        self.client = client
+        self.dates_key = f"{name}:dates"
+        self.users_key = f"{name}:users"
+        self._push = client.register_script(PUSH_SCRIPT)
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    async def push(self, user_id: UUID, start_date: date) -> None:
+        await self._push(keys=[self.dates_key, self.users_key], args=[str(user_id), start_date.isoformat()])
+
+    async def pop(self, timeout: float) -> Optional[tuple[UUID, date]]:
+        """Wait for the next job, returning None if there is none within the timeout"""
+        result = await self.client.blpop([self.users_key], timeout)
+        if (result == None):
+            return None
+
+        # Skip users whose pending date has gone missing (e.g. if the hash was cleared)
+        user_id = result[1].decode()
+        start_date = await self._take(keys=[self.dates_key], args=[user_id])
+        if (start_date == None):
+            return None
+        return UUID(user_id), date.fromisoformat(start_date.decode())
+
+# Users with schedules to refresh in the background, optionally shared between workers through Valkey
+schedule_refresh_queue = ValkeyRefreshQueue(valkey_client, "schedule_refresh") if SCHEDULE_PRECOMPUTE_SHARED else InMemoryRefreshQueue()
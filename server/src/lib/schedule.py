@@ -8,11 +8,37 @@ from domain.users.preferences.repositories import PreferenceRepository
 from domain.users.events.repositories import EventRepository
 from domain.users.habits.repositories import HabitRepository
 from lib.time import convert_to_utc
-from lib.constraint import TimeBlock, schedule_daily_items, schedule_weekly_items
+from lib.constraint import TimeBlock, ScheduleItemDetails, get_interval_range, schedule_daily_items, schedule_weekly_items
+from lib.metrics import increment, register
+from lib.cache import TieredCache
+from lib.executor import start_solver_executor, shutdown_solver_executor
+from lib.single_flight import SingleFlight
+from middleware.auth import valkey_client, valkey_store
+from config.settings import SOLVER_ENGINE, SOLVER_SLOT_MINUTES, SOLVER_NODE_BUDGET, SOLVER_TIME_BUDGET, SOLVER_GREEDY, SOLVER_POOL_SIZE, SOLVER_REPAIR, \
+    SOLVER_CACHE_SIZE, SOLVER_CACHE_TTL, SOLVER_CACHE_SHARED
+from litestar import Litestar
+from litestar.exceptions import ClientException
 from datetime import time, date, datetime, timedelta
 from pytz import timezone
-from math import floor
+from math import floor, ceil
 from copy import deepcopy
+from contextlib import asynccontextmanager, AbstractAsyncContextManager
+from typing import AsyncGenerator, Optional
+from uuid import UUID
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Solver results shared by identical problems, optionally across workers through Valkey
+solution_cache = TieredCache(SOLVER_CACHE_SIZE, SOLVER_CACHE_TTL, valkey_store.with_namespace("solutions") if SOLVER_CACHE_SHARED else None)
+register("solution_cache", solution_cache.stats)
+
+# Only one request or background refresh generates a user's week at a time, across all workers
+schedule_generation = SingleFlight(valkey_client, "schedule_generation", lock_timeout=60, wait_timeout=30)
+
+# Length of the time slots schedule items are placed on
+SECONDS_PER_SLOT = SOLVER_SLOT_MINUTES * 60
 
 # Time preference constants
 MORNING = [(6 * 3600, 12 * 3600)]                   # 6am - 12pm
@@ -48,12 +74,52 @@ def get_time_obj_blocks(start_time: time, end_time: time) -> list[tuple[time, ti
 
     return time_obj_blocks
 
-def get_schedule_time_blocks(schedule: Schedule) -> list[TimeBlock]:
-    return [
-        (schedule_item.start_time.hour * 3600 + schedule_item.start_time.minute * 60 + schedule_item.start_time.second,
+def get_schedule_item_time_block(schedule_item: ScheduleItem) -> TimeBlock:
+    return (schedule_item.start_time.hour * 3600 + schedule_item.start_time.minute * 60 + schedule_item.start_time.second,
         schedule_item.end_time.hour * 3600 + schedule_item.end_time.minute * 60 + schedule_item.end_time.second)
-        for schedule_item in schedule.schedule_items
-    ]
+
+def get_schedule_time_blocks(schedule: Schedule, excluded_type: Optional[ScheduleItemTypeEnum] = None) -> list[TimeBlock]:
+    return [get_schedule_item_time_block(schedule_item) for schedule_item in schedule.schedule_items if schedule_item.schedule_item_type != excluded_type]
+
+def reconcile_schedule_items(schedule: Schedule, schedule_item_type: ScheduleItemTypeEnum, schedule_items: list[ScheduleItem]) -> None:
+    """Replace the schedule's items of a type with the given items, reusing the previous items (and their ids) where possible so
+    that saving the schedule only inserts, updates and deletes the items which changed. Previous items with the same name and times
+    are kept as they are, and the rest are moved to the new times of items with the same name"""
+    previous_schedule_items = [schedule_item for schedule_item in schedule.schedule_items if schedule_item.schedule_item_type == schedule_item_type]
+    other_schedule_items = [schedule_item for schedule_item in schedule.schedule_items if schedule_item.schedule_item_type != schedule_item_type]
+
+    # Keep previous items which have not changed
+    unchanged_schedule_items: dict[tuple[str, time, time], list[ScheduleItem]] = {}
+    for schedule_item in previous_schedule_items:
+        unchanged_schedule_items.setdefault((schedule_item.name, schedule_item.start_time, schedule_item.end_time), []).append(schedule_item)
+
+    reconciled_schedule_items = list(schedule_items)
+    changed_indices = []
+    for i, schedule_item in enumerate(schedule_items):
+        matches = unchanged_schedule_items.get((schedule_item.name, schedule_item.start_time, schedule_item.end_time))
+        if (matches):
+            reconciled_schedule_items[i] = matches.pop()
+            increment("schedule_items_kept")
+        else:
+            changed_indices.append(i)
+
+    # Move the remaining previous items to the new times, pairing items with the same name in order of start time
+    unmatched_schedule_items = sorted((schedule_item for matches in unchanged_schedule_items.values() for schedule_item in matches), key=lambda schedule_item: schedule_item.start_time)
+    for i in sorted(changed_indices, key=lambda i: schedule_items[i].start_time):
+        schedule_item = schedule_items[i]
+        previous_schedule_item = next((previous_schedule_item for previous_schedule_item in unmatched_schedule_items if previous_schedule_item.name == schedule_item.name), None)
+        if (previous_schedule_item != None):
+            unmatched_schedule_items.remove(previous_schedule_item)
+            previous_schedule_item.start_time = schedule_item.start_time
+            previous_schedule_item.end_time = schedule_item.end_time
+            reconciled_schedule_items[i] = previous_schedule_item
+            increment("schedule_items_moved")
+        else:
+            increment("schedule_items_added")
+
+    # Previous items left unmatched are deleted as orphans when the schedule is saved
+    increment("schedule_items_removed", len(unmatched_schedule_items))
+    schedule.schedule_items = other_schedule_items + reconciled_schedule_items
 
 def get_events_for_the_day(event_date: date, events: list[Event], timezone_format: timezone) -> list[Event]:
     event_date_start_time = convert_to_utc(timezone_format, datetime(event_date.year, event_date.month, event_date.day))
@@ -64,12 +130,135 @@ def requires_refresh(schedule: Schedule) -> bool:
     return schedule.requires_event_refresh or schedule.requires_habit_refresh \
         or schedule.requires_sleep_refresh or schedule.requires_work_refresh
 
+def get_week_start(schedule_date: date) -> date:
+    return schedule_date - timedelta(days=schedule_date.weekday())
+
+def create_week_schedules(user_id: UUID, week_start: date) -> list[Schedule]:
+    """Create empty schedules for each day of the week starting on the given date"""
+    return [Schedule(user_id=user_id, date=week_start + timedelta(days=i)) for i in range(7)]
+
+def lock_week(user_id: UUID, week_start: date) -> AbstractAsyncContextManager[None]:
+    """Lock the user's week for generating or refreshing its schedules"""
+    return schedule_generation.lock(f"{user_id}:{week_start.isoformat()}")
+
 def get_weekly_preferred_times(daily_preferred_times: list[tuple[int, int]]) -> list[tuple[int, int]]:
     weekly_preferred_times = []
     for preferred_times in daily_preferred_times:
         weekly_preferred_times += [(preferred_times[0] + i * 86400, preferred_times[1] + i * 86400) for i in range(7)]
     return weekly_preferred_times
 
+@asynccontextmanager
+async def solver_executor_lifespan(_: Litestar) -> AsyncGenerator[None, None]:
+    await start_solver_executor(SOLVER_POOL_SIZE)
+    try:
+        yield
+    finally:
+        shutdown_solver_executor()
+
+def report_unplaced_items(schedule: Schedule, unplaced_items: list[ScheduleItemDetails]) -> None:
+    """Log the items left out of a schedule because the solver ran out of budget"""
+    if (len(unplaced_items) != 0):
+        increment("partial_schedules")
+        logger.warning(
+            "Solver budget ran out for user %s on %s, leaving items unplaced: %s",
+            schedule.user_id, schedule.date, ", ".join(name for name, _, _ in unplaced_items)
+        )
+
+def get_repairable_schedule_items(
+    previous_schedule_items: list[ScheduleItem],
+    items: list[ScheduleItemDetails],
+    time_blocks: list[TimeBlock],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int
+) -> tuple[list[ScheduleItem], list[int]]:
+    """Match previous schedule items to the items being scheduled by name and length, keeping those which still do not overlap the
+    occupied time blocks or each other, start within the item's preferred times (if it has any), and are at least the preferred
+    spacing away from the other kept items. Returns the kept schedule items and the indices of the items left to place"""
+    occupied_blocks = list(time_blocks)
+    unmatched_schedule_items = list(previous_schedule_items)
+    kept_intervals = []
+    kept_schedule_items = []
+    remaining_indices = []
+    preferred_value_spacing = ceil(preferred_spacing / SECONDS_PER_SLOT)
+    for i, (name, duration, _) in enumerate(items):
+        preferred_intervals = [get_interval_range(preferred_time, SECONDS_PER_SLOT) for preferred_time in preferred_times[i]]
+        for schedule_item in unmatched_schedule_items:
+            # Check that the schedule item is still the same length
+            start, end = get_schedule_item_time_block(schedule_item)
+            first_interval, last_interval = get_interval_range((start, end), SECONDS_PER_SLOT)
+            if (schedule_item.name != name or last_interval - first_interval + 1 != ceil(duration / SECONDS_PER_SLOT)):
+                continue
+
+            # Check that it still meets the current preferences, which may have changed since it was placed
+            if (len(preferred_intervals) != 0 and not any(first <= first_interval <= last for first, last in preferred_intervals)):
+                continue
+            if (any(first_interval - kept_last - 1 < preferred_value_spacing and kept_first - last_interval - 1 < preferred_value_spacing for kept_first, kept_last in kept_intervals)):
+                continue
+
+            # Keep it if it is still free of conflicts
+            if (not any(start < block_end and block_start < end for block_start, block_end in occupied_blocks)):
+                unmatched_schedule_items.remove(schedule_item)
+                kept_schedule_items.append(schedule_item)
+                occupied_blocks.append((start, end))
+                kept_intervals.append((first_interval, last_interval))
+                break
+        else:
+            remaining_indices.append(i)
+
+    return kept_schedule_items, remaining_indices
+
+async def repair_daily_items(
+    previous_schedule_items: list[ScheduleItem],
+    time_blocks: list[TimeBlock],
+    daily_items: list[ScheduleItemDetails],
+    preferred_times: list[list[TimeBlock]],
+    preferred_spacing: int
+) -> tuple[list[ScheduleItem], list[ScheduleItemDetails]]:
+    """Schedule the daily items, keeping the previous schedule items which are still consistent with the occupied time blocks and the
+    current preferences, and only solving for the displaced or new items. Falls back to solving for every item when the kept items
+    leave no room for the rest"""
+    if (SOLVER_REPAIR):
+        kept_schedule_items, remaining_indices = get_repairable_schedule_items(previous_schedule_items, daily_items, time_blocks, preferred_times, preferred_spacing)
+        if (len(kept_schedule_items) != 0):
+            increment("schedule_repairs")
+            if (len(remaining_indices) == 0):
+                return kept_schedule_items, []
+
+            # Keep the preferred spacing clear around the kept items, since the solver only spaces out the items it places
+            kept_blocks = [get_schedule_item_time_block(schedule_item) for schedule_item in kept_schedule_items]
+            spaced_blocks = [(max(start - preferred_spacing, 0), min(end + preferred_spacing, 24 * 3600)) for start, end in kept_blocks]
+            try:
+                schedule_items, unplaced_items = await schedule_daily_items(
+                    time_blocks + spaced_blocks,
+                    [daily_items[i] for i in remaining_indices],
+                    [preferred_times[i] for i in remaining_indices],
+                    preferred_spacing,
+                    seconds_per_interval=SECONDS_PER_SLOT,
+                    engine=SOLVER_ENGINE,
+                    max_nodes=SOLVER_NODE_BUDGET,
+                    time_limit=SOLVER_TIME_BUDGET,
+                    greedy=SOLVER_GREEDY,
+                    solution_cache=solution_cache
+                )
+                if (len(unplaced_items) == 0):
+                    return kept_schedule_items + schedule_items, []
+            except ClientException:
+                pass
+            increment("schedule_repair_fallbacks")
+
+    return await schedule_daily_items(
+        time_blocks,
+        daily_items,
+        preferred_times,
+        preferred_spacing,
+        seconds_per_interval=SECONDS_PER_SLOT,
+        engine=SOLVER_ENGINE,
+        max_nodes=SOLVER_NODE_BUDGET,
+        time_limit=SOLVER_TIME_BUDGET,
+        greedy=SOLVER_GREEDY,
+        solution_cache=solution_cache
+    )
+
 class ScheduleBuilder:
     schedule: Schedule
 
@@ -80,16 +269,11 @@ class ScheduleBuilder:
         self.schedule.schedule_items.clear()
 
     def schedule_sleep_hours(self, preference: Preference) -> None:
-        # Remove previous sleep schedule
-        self.schedule.schedule_items = [
-            schedule_item for schedule_item in self.schedule.schedule_items
-            if schedule_item.schedule_item_type != ScheduleItemTypeEnum.SLEEP
-        ]
-
         # Create new sleep schedule
+        sleep_schedule_items = []
         if (preference != None and preference.sleep_time != None and preference.wake_up_time != None):
             time_obj_blocks = get_time_obj_blocks(preference.sleep_time, preference.wake_up_time)
-            self.schedule.schedule_items += [ScheduleItem(
+            sleep_schedule_items = [ScheduleItem(
                 name="Sleep",
                 start_time=time_obj_block[0],
                 end_time=time_obj_block[1],
@@ -97,20 +281,17 @@ class ScheduleBuilder:
                 schedule_id=self.schedule.id
             ) for time_obj_block in time_obj_blocks]
 
+        # Replace previous sleep schedule
+        reconcile_schedule_items(self.schedule, ScheduleItemTypeEnum.SLEEP, sleep_schedule_items)
+
         self.schedule.requires_sleep_refresh = False
 
     async def schedule_events(self, user: User, events_repo: EventRepository, timezone_format: timezone) -> None:
-        # Remove previous event items
-        self.schedule.schedule_items = [
-            schedule_item for schedule_item in self.schedule.schedule_items
-            if schedule_item.schedule_item_type != ScheduleItemTypeEnum.EVENT
-        ]
-
         # Create new event items
         start_time = convert_to_utc(timezone_format, datetime(self.schedule.date.year, self.schedule.date.month, self.schedule.date.day))
         end_time = start_time + timedelta(days=1)
         events = await events_repo.get_events_in_range(user.id, start_time, end_time, timezone_format)
-        self.schedule.schedule_items += [
+        event_schedule_items = [
             ScheduleItem(
                 name=event.summary,
                 start_time=time() if (event.start_time.date() < self.schedule.date) else event.start_time.time(),
@@ -119,17 +300,20 @@ class ScheduleBuilder:
             ) for event in events
         ]
 
+        # Replace previous event items
+        reconcile_schedule_items(self.schedule, ScheduleItemTypeEnum.EVENT, event_schedule_items)
+
         self.schedule.requires_event_refresh = False
 
-    def schedule_habits(self, daily_habits: list[Habit]) -> None:
-        # Remove previous habit sessions
-        self.schedule.schedule_items = [
+    async def schedule_habits(self, daily_habits: list[Habit]) -> None:
+        # Set previous habit sessions aside so that those which still fit can be kept
+        previous_habit_sessions = [
             schedule_item for schedule_item in self.schedule.schedule_items
-            if schedule_item.schedule_item_type != ScheduleItemTypeEnum.HABIT
+            if schedule_item.schedule_item_type == ScheduleItemTypeEnum.HABIT
         ]
 
-        # Get occupied timeblocks
-        time_blocks = get_schedule_time_blocks(self.schedule)
+        # Get timeblocks occupied by other items
+        time_blocks = get_schedule_time_blocks(self.schedule, ScheduleItemTypeEnum.HABIT)
 
         # Preferred break length
         preferred_spacing = 3600 # Default one hour spacing for now
@@ -146,24 +330,27 @@ class ScheduleBuilder:
             preferred_times.append(curr_preferred_times)
 
         # Get habit sessions
-        self.schedule.schedule_items += schedule_daily_items(
+        schedule_items, unplaced_items = await repair_daily_items(
+            previous_habit_sessions,
             time_blocks,
             [(habit.name, habit.duration * 60, ScheduleItemTypeEnum.HABIT) for habit in daily_habits],
             preferred_times,
             preferred_spacing
         )
+        reconcile_schedule_items(self.schedule, ScheduleItemTypeEnum.HABIT, schedule_items)
+        report_unplaced_items(self.schedule, unplaced_items)
 
         self.schedule.requires_habit_refresh = False
 
-    def schedule_work_sessions(self, preference: Preference) -> None:
-        # Remove previous work sessions
-        self.schedule.schedule_items = [
+    async def schedule_work_sessions(self, preference: Preference) -> None:
+        # Set previous work sessions aside so that those which still fit can be kept
+        previous_work_sessions = [
             schedule_item for schedule_item in self.schedule.schedule_items
-            if schedule_item.schedule_item_type != ScheduleItemTypeEnum.FOCUS_SESSION
+            if schedule_item.schedule_item_type == ScheduleItemTypeEnum.FOCUS_SESSION
         ]
 
-        # Get occupied timeblocks
-        time_blocks = get_schedule_time_blocks(self.schedule) + get_time_blocks(preference.end_of_work_day, preference.start_of_work_day)
+        # Get timeblocks occupied by other items
+        time_blocks = get_schedule_time_blocks(self.schedule, ScheduleItemTypeEnum.FOCUS_SESSION) + get_time_blocks(preference.end_of_work_day, preference.start_of_work_day)
 
         # Get best focus times and preferred break length
         best_focus_times = []
@@ -174,12 +361,15 @@ class ScheduleBuilder:
                 best_focus_times += get_time_blocks(preferred_time_interval.start_time, preferred_time_interval.end_time)
 
         # Get work sessions
-        self.schedule.schedule_items += schedule_daily_items(
+        schedule_items, unplaced_items = await repair_daily_items(
+            previous_work_sessions,
             time_blocks,
             [("Work session", 3600, ScheduleItemTypeEnum.FOCUS_SESSION) for i in range(4)],
             [best_focus_times for i in range(4)],
             preferred_break_length
         )
+        reconcile_schedule_items(self.schedule, ScheduleItemTypeEnum.FOCUS_SESSION, schedule_items)
+        report_unplaced_items(self.schedule, unplaced_items)
 
         self.schedule.requires_work_refresh = False
 
@@ -229,15 +419,12 @@ class WeeklyScheduleBuilder:
 
             schedule.requires_event_refresh = False
 
-    def schedule_habits(self, habits: list[Habit]) -> None:
+    async def schedule_habits(self, habits: list[Habit]) -> None:
         daily_habits = [habit for habit in habits if habit.repeat_interval == RepeatIntervalEnum.DAILY]
         weekly_habits = [habit for habit in habits if habit.repeat_interval == RepeatIntervalEnum.WEEKLY]
 
-        # Schedule daily habits
-        schedule_builder = ScheduleBuilder(self.schedules[0])
-        for schedule in self.schedules:
-            schedule_builder.schedule = schedule
-            schedule_builder.schedule_habits(daily_habits)
+        # Schedule daily habits, solving each day in parallel
+        await asyncio.gather(*(ScheduleBuilder(schedule).schedule_habits(daily_habits) for schedule in self.schedules))
 
         # Schedule weekly habits
         num_weekly_habit_instances = sum(habit.frequency for habit in weekly_habits)
@@ -270,15 +457,25 @@ class WeeklyScheduleBuilder:
                 weekly_items += [(habit.name, habit.duration * 60, ScheduleItemTypeEnum.HABIT)] * habit.frequency
 
             # Get habit sessions
-            scheduled_weekly_habits = schedule_weekly_items(time_blocks, weekly_items, preferred_times, preferred_spacing)
+            scheduled_weekly_habits, unplaced_items = await schedule_weekly_items(
+                time_blocks,
+                weekly_items,
+                preferred_times,
+                preferred_spacing,
+                seconds_per_interval=SECONDS_PER_SLOT,
+                engine=SOLVER_ENGINE,
+                max_nodes=SOLVER_NODE_BUDGET,
+                time_limit=SOLVER_TIME_BUDGET,
+                greedy=SOLVER_GREEDY,
+                solution_cache=solution_cache
+            )
             for i, schedule_items in enumerate(scheduled_weekly_habits):
                 self.schedules[i].schedule_items += schedule_items
+            report_unplaced_items(self.schedules[0], unplaced_items)
 
-    def schedule_work_sessions(self, preference: Preference) -> None:
-        schedule_builder = ScheduleBuilder(self.schedules[0])
-        for schedule in self.schedules:
-            schedule_builder.schedule = schedule
-            schedule_builder.schedule_work_sessions(preference)
+    async def schedule_work_sessions(self, preference: Preference) -> None:
+        # Solve each day in parallel
+        await asyncio.gather(*(ScheduleBuilder(schedule).schedule_work_sessions(preference) for schedule in self.schedules))
 
 class ScheduleDirector:
 
@@ -307,11 +504,11 @@ class ScheduleDirector:
         # Schedule habits
         if (builder.schedule.requires_habit_refresh):
             daily_habits = await habits_repo.list(user_id = user.id, repeat_interval = RepeatIntervalEnum.DAILY)
-            builder.schedule_habits(daily_habits)
+            await builder.schedule_habits(daily_habits)
 
         # Schedule work sessions
         if (builder.schedule.requires_work_refresh):
-            builder.schedule_work_sessions(preference)
+            await builder.schedule_work_sessions(preference)
 
 class WeeklyScheduleDirector:
 
@@ -332,5 +529,5 @@ class WeeklyScheduleDirector:
         builder.reset()
         builder.schedule_sleep_hours(preference)
         await builder.schedule_events(user, events_repo, timezone_format)
-        builder.schedule_habits(habits)
-        builder.schedule_work_sessions(preference)
\ No newline at end of file
+        await builder.schedule_habits(habits)
+        await builder.schedule_work_sessions(preference)
\ No newline at end of file
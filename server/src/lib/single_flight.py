@@ -0,0 +1,67 @@
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from lib.metrics import increment
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
+import asyncio
+
+class SingleFlight:
+    """Keyed lock letting one caller at a time do the work for a key. Callers in the same worker wait on the holder's future
+    rather than polling, and a Valkey lock keeps callers in other workers out. Callers should check whether the work is still
+    needed once they hold the lock, since it has usually just been done by the previous holder"""
+    client: Optional[Redis]
+    name: str
+    lock_timeout: float
+    wait_timeout: float
+    in_flight: dict[str, asyncio.Future]
+
+    def __init__(self, client: Optional[Redis], name: str, lock_timeout: float, wait_timeout: float) -> None:
+        self.client = client
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.in_flight = {}
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncGenerator[None, None]:
+        # Wait for the work in flight in this worker to finish
+        while (key in self.in_flight):
+            increment(f"{self.name}_waits")
+            await asyncio.shield(self.in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            async with self.shared_lock(key):
+                yield
+        finally:
+            del self.in_flight[key]
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def shared_lock(self, key: str) -> AsyncGenerator[None, None]:
+        """Hold the Valkey lock for a key. The work goes ahead without it if Valkey cannot be reached or the lock is not
+        released in time, since doing the work twice is better than failing the request"""
+        if (self.client == None):
+            yield
+            return
+
+        # Acquire lock
+        shared_lock = self.client.lock(f"{self.name}:{key}", timeout=self.lock_timeout, blocking_timeout=self.wait_timeout, thread_local=False)
+        try:
+            acquired = await shared_lock.acquire()
+            if (not acquired):
+                increment(f"{self.name}_lock_timeouts")
+        except RedisError:
+            acquired = False
+            increment(f"{self.name}_lock_errors")
+
+        try:
+            yield
+        finally:
+            # Release lock, which may have already expired
+            if (acquired):
+                try:
+                    await shared_lock.release()
+                except RedisError:
+                    increment(f"{self.name}_lock_errors")
@@ -1,7 +1,11 @@
 from pytz import utc, timezone
-from datetime import time, datetime
+from datetime import time, date, datetime, timedelta
+from typing import Optional
 from math import floor
 
+# Range of dates where a missing start or end leaves that side open
+type DateRange = tuple[Optional[date], Optional[date]]
+
 def convert_to_utc(tz: timezone, dt: datetime) -> datetime:
     return tz.normalize(tz.localize(dt)).astimezone(utc)
 
@@ -20,4 +24,18 @@ def get_time_difference(start_time: time, end_time: time) -> int:
     end = end_time.hour * 3600 + end_time.minute * 60 + end_time.second
     if (end_time < start_time):
         end += 86400
-    return end - start
\ No newline at end of file
+    return end - start
+
+def get_local_date_range(start_time: datetime, end_time: datetime) -> DateRange:
+    """Get the range of dates a UTC time range can fall on in any timezone"""
+    return (start_time.date() - timedelta(days=1), end_time.date() + timedelta(days=1))
+
+def get_earliest_current_date() -> date:
+    """Get the earliest date which is the current date in some timezone"""
+    return datetime.now(utc).date() - timedelta(days=1)
+
+def merge_date_ranges(first: DateRange, second: DateRange) -> DateRange:
+    """Get the smallest date range covering both ranges"""
+    start_date = None if (first[0] == None or second[0] == None) else min(first[0], second[0])
+    end_date = None if (first[1] == None or second[1] == None) else max(first[1], second[1])
+    return (start_date, end_date)
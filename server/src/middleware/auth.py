@@ -1,7 +1,9 @@
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import select, inspect
 from sqlalchemy.exc import NoResultFound
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
+from litestar import Litestar
 from litestar.connection import ASGIConnection
 from litestar.exceptions import NotAuthorizedException
 from litestar.middleware import AbstractAuthenticationMiddleware, AuthenticationResult
@@ -10,13 +12,70 @@ from litestar.stores.redis import RedisStore
 
 from models.user import User
 from lib.token import parse_claims
-from config.settings import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, SSL_MODE, \
-    AUTH_DB_USER, AUTH_DB_PASSWORD, AUTH_DB_HOST, AUTH_DB_PORT, AUTH_TLS_ENABLED
+from lib.cache import TTLCache
+from lib.metrics import register
+from config.plugins import session_maker
+from config.settings import AUTH_DB_USER, AUTH_DB_PASSWORD, AUTH_DB_HOST, AUTH_DB_PORT, AUTH_TLS_ENABLED, \
+    USER_CACHE_SIZE, USER_CACHE_TTL
 
-valkey_store = RedisStore.with_client(url=f"{"rediss" if AUTH_TLS_ENABLED else "redis"}://{AUTH_DB_USER}:{AUTH_DB_PASSWORD}@{AUTH_DB_HOST}:{AUTH_DB_PORT}")
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import Any, AsyncGenerator, Mapping
+from uuid import UUID
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+valkey_client = Redis.from_url(f"{"rediss" if AUTH_TLS_ENABLED else "redis"}://{AUTH_DB_USER}:{AUTH_DB_PASSWORD}@{AUTH_DB_HOST}:{AUTH_DB_PORT}")
+valkey_store = RedisStore(valkey_client, handle_client_shutdown=True)
 blacklist_store = valkey_store.with_namespace("blacklist")
 token_family_store = valkey_store.with_namespace("token_family")
 
+# Snapshots of authenticated users' columns keyed by user id. Each request gets its own User built from the snapshot, so
+# changes made to it by one request are never seen by another
+USER_INVALIDATION_CHANNEL = "user_cache_invalidation"
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+register("user_cache", user_cache.stats)
+
+def get_user_snapshot(user: User) -> Mapping[str, Any]:
+    return MappingProxyType({column.key: getattr(user, column.key) for column in inspect(User).column_attrs if not column.key.startswith("_")})
+
+async def invalidate_user(user_id: UUID | str) -> None:
+    """Remove a user from the cache of every worker. Must be called whenever a user is modified or deleted. Other workers keep
+    their cached copy until it expires if the invalidation cannot be published"""
+    user_cache.invalidate(str(user_id))
+    try:
+        await valkey_client.publish(USER_INVALIDATION_CHANNEL, str(user_id))
+    except RedisError:
+        logger.exception("Failed to publish cache invalidation for user %s", user_id)
+
+async def listen_for_user_invalidations() -> None:
+    while True:
+        pubsub = valkey_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+
+            # Invalidations may have been missed while disconnected
+            user_cache.clear()
+
+            async for message in pubsub.listen():
+                user_cache.invalidate(message["data"].decode())
+        except RedisError:
+            # Stop serving cached users until the subscription is restored
+            user_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.reset()
+
+@asynccontextmanager
+async def user_cache_lifespan(_: Litestar) -> AsyncGenerator[None, None]:
+    listener = asyncio.create_task(listen_for_user_invalidations())
+    try:
+        yield
+    finally:
+        listener.cancel()
+
 class JWTAuthenticationMiddleware(AbstractAuthenticationMiddleware):
     async def authenticate_request(self, connection: ASGIConnection) -> AuthenticationResult:
         # Check that the authorization header is included
@@ -38,16 +97,21 @@ class JWTAuthenticationMiddleware(AbstractAuthenticationMiddleware):
         # Parse access token claims
         access_claims = parse_claims(access_token)
 
-        # Get user
-        session_maker = async_sessionmaker()
-        engine = create_async_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={SSL_MODE}")
-        async with session_maker(bind=engine) as session:
+        # Get user from the cache
+        user_snapshot = user_cache.get(access_claims["user_id"])
+        if (user_snapshot != None):
+            return AuthenticationResult(user=User(**user_snapshot), auth=access_claims)
+
+        # Fall back to the database
+        async with session_maker() as session:
             try:
                 user_result = await session.execute(select(User).where(User.id == access_claims["user_id"]))
                 user = user_result.scalar_one()
             except NoResultFound:
                 raise NotAuthorizedException
 
-        return AuthenticationResult(user=user, auth=access_claims)
+        user_snapshot = get_user_snapshot(user)
+        user_cache.set(access_claims["user_id"], user_snapshot)
+        return AuthenticationResult(user=User(**user_snapshot), auth=access_claims)
 
-auth_middleware = DefineMiddleware(JWTAuthenticationMiddleware)
\ No newline at end of file
+auth_middleware = DefineMiddleware(JWTAuthenticationMiddleware)
@@ -1,6 +1,6 @@
 from sqlalchemy import Enum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.schema import CheckConstraint, ForeignKey
+from sqlalchemy.schema import CheckConstraint, ForeignKey, Index
 from litestar.contrib.sqlalchemy.base import UUIDBase
 from typing import Optional
 from datetime import datetime
@@ -15,7 +15,10 @@ class RepeatRuleEnum(str, enum.Enum):
 
 class Event(UUIDBase):
     __tablename__ = "events"
-    __table_args__ = (CheckConstraint("start_time <= end_time", name="start_time_lte_end_time"),)
+    __table_args__ = (
+        CheckConstraint("start_time <= end_time", name="start_time_lte_end_time"),
+        Index("ix_events_user_id_repeat_rule_start_time", "user_id", "repeat_rule", "start_time")
+    )
 
     summary: Mapped[str]
     start_time: Mapped[datetime]
@@ -1,10 +1,11 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, UniqueConstraint
 from litestar.contrib.sqlalchemy.base import UUIDBase
 from datetime import date
 
 class Schedule(UUIDBase):
     __tablename__ = "schedules"
+    __table_args__ = (UniqueConstraint("user_id", "date", name="uq_schedules_user_id_date"),)
 
     date: Mapped[date]
     requires_event_refresh: Mapped[bool] = mapped_column(default=True)
@@ -8,6 +8,7 @@ from domain.users.tasks.controllers import TaskController
 from domain.users.events.controllers import EventController
 from domain.users.habits.controllers import HabitController
 from domain.users.schedules.controllers import ScheduleController
+from domain.metrics.controllers import MetricsController
 
 schedule_router = Router(path="/schedules", route_handlers=[ScheduleController])
 habit_router = Router(path="/habits", route_handlers=[HabitController])
@@ -20,5 +21,6 @@ user_router = Router(
     route_handlers=[UserController, preference_router, tag_router, task_router, event_router, habit_router, schedule_router],
     dependencies={"user": Provide(provide_user)}
 )
-v1_router = Router(path="/v1", route_handlers=[user_router])
+metrics_router = Router(path="/metrics", route_handlers=[MetricsController])
+v1_router = Router(path="/v1", route_handlers=[user_router, metrics_router])
 router = Router(path="/api", route_handlers=[v1_router])
\ No newline at end of file
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Make the server's modules importable, and give the settings which are parsed at import time placeholder values. Nothing
+# connects to the database or Valkey until it is used
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+os.environ.setdefault("ACCESS_TOKEN_MINUTE_LIFESPAN", "15")
+os.environ.setdefault("REFRESH_TOKEN_HOUR_LIFESPAN", "24")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("AUTH_DB_PORT", "6379")
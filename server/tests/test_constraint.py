@@ -0,0 +1,125 @@
+from math import ceil
+from random import Random
+from typing import Optional
+
+import app # Registers every model with the ORM
+from models.schedule_item import ScheduleItemTypeEnum
+from lib.constraint import TimeBlock, ScheduleItemDetails, StartIntervals, LIST_ENGINE, BITSET_ENGINE, MIN_CONFLICTS_ENGINE, SECONDS_PER_DAY, \
+    solve_start_intervals, find_unfittable_items, split_into_days
+
+SECONDS_PER_INTERVAL = 900
+NUM_INTERVALS = 16
+
+def get_free_intervals(time_blocks: list[TimeBlock]) -> list[bool]:
+    return [
+        not any(start < (interval + 1) * SECONDS_PER_INTERVAL and interval * SECONDS_PER_INTERVAL < end for start, end in time_blocks)
+        for interval in range(NUM_INTERVALS)
+    ]
+
+def find_solution_by_brute_force(time_blocks: list[TimeBlock], items: list[ScheduleItemDetails]) -> Optional[list[int]]:
+    """Try every start interval for every item"""
+    free_intervals = get_free_intervals(time_blocks)
+    durations = [ceil(duration / SECONDS_PER_INTERVAL) for _, duration, _ in items]
+
+    def place(i: int) -> Optional[list[int]]:
+        if (i == len(items)):
+            return []
+        for start in range(NUM_INTERVALS - durations[i] + 1):
+            if (all(free_intervals[start:start + durations[i]])):
+                free_intervals[start:start + durations[i]] = [False] * durations[i]
+                rest = place(i + 1)
+                free_intervals[start:start + durations[i]] = [True] * durations[i]
+                if (rest != None):
+                    return [start] + rest
+        return None
+
+    return place(0)
+
+def check_valid(time_blocks: list[TimeBlock], items: list[ScheduleItemDetails], start_intervals: StartIntervals) -> None:
+    """Check that the placed items stay within the horizon and overlap neither the time blocks nor each other"""
+    free_intervals = get_free_intervals(time_blocks)
+    assert len(start_intervals) == len(items)
+    for (_, duration, _), start in zip(items, start_intervals):
+        if (start == None):
+            continue
+        end = start + ceil(duration / SECONDS_PER_INTERVAL)
+        assert 0 <= start and end <= NUM_INTERVALS
+        assert all(free_intervals[start:end])
+        free_intervals[start:end] = [False] * (end - start)
+
+def random_problem(rng: Random) -> tuple[list[TimeBlock], list[ScheduleItemDetails], list[list[TimeBlock]], int]:
+    time_blocks = []
+    for _ in range(rng.randint(0, 4)):
+        start = rng.randrange(0, NUM_INTERVALS * SECONDS_PER_INTERVAL, 300)
+        time_blocks.append((start, min(start + rng.randrange(300, 4 * SECONDS_PER_INTERVAL, 300), NUM_INTERVALS * SECONDS_PER_INTERVAL)))
+
+    # Items sharing names are interchangeable, which the search uses to prune symmetric assignments
+    items = [(rng.choice(["A", "B", "C"]), rng.choice([900, 1800, 2700, 3600]), ScheduleItemTypeEnum.HABIT) for _ in range(rng.randint(1, 5))]
+    preferred_times = []
+    for _ in items:
+        start = rng.randrange(0, NUM_INTERVALS) * SECONDS_PER_INTERVAL
+        preferred_times.append(rng.choice([[], [(start, start + 2 * SECONDS_PER_INTERVAL)]]))
+    return time_blocks, items, preferred_times, rng.choice([0, 900, 1800])
+
+def solve(problem: tuple, engine: str, greedy: bool = False) -> Optional[StartIntervals]:
+    time_blocks, items, preferred_times, preferred_spacing = problem
+    start_intervals, _ = solve_start_intervals(time_blocks, items, preferred_times, preferred_spacing, NUM_INTERVALS, SECONDS_PER_INTERVAL, engine, greedy=greedy)
+    return start_intervals
+
+def test_backtracking_engines_agree_with_brute_force():
+    rng = Random(0)
+    for _ in range(1000):
+        problem = random_problem(rng)
+        time_blocks, items, _, _ = problem
+        feasible = find_solution_by_brute_force(time_blocks, items) != None
+        for engine in (LIST_ENGINE, BITSET_ENGINE):
+            for greedy in (False, True):
+                start_intervals = solve(problem, engine, greedy)
+                assert (start_intervals != None) == feasible, (problem, engine, greedy)
+                if (start_intervals != None):
+                    assert None not in start_intervals
+                    check_valid(time_blocks, items, start_intervals)
+
+def test_backtracking_engines_produce_identical_schedules():
+    rng = Random(1)
+    for _ in range(500):
+        problem = random_problem(rng)
+        assert solve(problem, LIST_ENGINE) == solve(problem, BITSET_ENGINE), problem
+
+def test_budgeted_search_returns_valid_partial_schedules():
+    rng = Random(2)
+    for _ in range(300):
+        problem = random_problem(rng)
+        time_blocks, items, preferred_times, preferred_spacing = problem
+        for engine in (LIST_ENGINE, BITSET_ENGINE):
+            start_intervals, _ = solve_start_intervals(time_blocks, items, preferred_times, preferred_spacing, NUM_INTERVALS, SECONDS_PER_INTERVAL, engine, max_nodes=3)
+            if (start_intervals != None):
+                check_valid(time_blocks, items, start_intervals)
+
+def test_local_search_places_items_validly():
+    rng = Random(3)
+    for _ in range(300):
+        problem = random_problem(rng)
+        time_blocks, items, preferred_times, preferred_spacing = problem
+        start_intervals, _ = solve_start_intervals(time_blocks, items, preferred_times, preferred_spacing, NUM_INTERVALS, SECONDS_PER_INTERVAL, MIN_CONFLICTS_ENGINE, max_nodes=500)
+        assert start_intervals != None
+        check_valid(time_blocks, items, start_intervals)
+
+def test_precheck_never_rejects_problems_which_fit():
+    rng = Random(4)
+    rejected = 0
+    for _ in range(2000):
+        time_blocks, items, _, _ = random_problem(rng)
+        unfittable_items = find_unfittable_items(time_blocks, items, NUM_INTERVALS, SECONDS_PER_INTERVAL)
+        if (find_solution_by_brute_force(time_blocks, items) != None):
+            assert unfittable_items == [], (time_blocks, items)
+        rejected += len(unfittable_items) != 0
+
+    # Make sure the random problems include ones the pre-check rejects
+    assert rejected != 0
+
+def test_items_crossing_midnight_are_split_between_days():
+    schedule_items = list(split_into_days("Habit", ScheduleItemTypeEnum.HABIT, SECONDS_PER_DAY - 1800, SECONDS_PER_DAY + 1800))
+    assert [day for day, _ in schedule_items] == [0, 1]
+    assert [(schedule_item.start_time.hour, schedule_item.start_time.minute) for _, schedule_item in schedule_items] == [(23, 30), (0, 0)]
+    assert [(schedule_item.end_time.hour, schedule_item.end_time.minute) for _, schedule_item in schedule_items] == [(23, 59), (0, 30)]
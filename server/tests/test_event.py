@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from random import Random
+
+from lib.event import get_calendar_instance_start_times
+
+def get_reference_instance_start_times(
+    event_start_time: datetime,
+    event_duration: timedelta,
+    until: Optional[datetime],
+    repeat_months: int,
+    range_start: datetime,
+    range_end: datetime
+) -> list[datetime]:
+    """Step through every instance from the start of the series, as the repository did before the closed form expansion"""
+    instance_start_times = []
+    months = 0
+    while True:
+        month_index = event_start_time.month - 1 + months
+        year, month = event_start_time.year + month_index // 12, month_index % 12 + 1
+        months += repeat_months
+        if ((year, month) > (range_end.year, range_end.month) or (until != None and (year, month) > (until.year, until.month))):
+            return instance_start_times
+
+        # Skip days which do not exist in the month
+        try:
+            instance_start_time = event_start_time.replace(year=year, month=month)
+        except ValueError:
+            continue
+
+        if (instance_start_time >= range_end or (until != None and instance_start_time > until)):
+            return instance_start_times
+        if (instance_start_time + event_duration > range_start):
+            instance_start_times.append(instance_start_time)
+
+def expand(*args) -> list[datetime]:
+    return list(get_calendar_instance_start_times(*args))
+
+def random_event(rng: Random) -> tuple[datetime, timedelta, int]:
+    # Favour the ends of months, which do not exist in every month
+    day = rng.choice([1, 15, 28, 29, 30, 31])
+    while True:
+        try:
+            start_time = datetime(rng.randint(2000, 2030), rng.randint(1, 12), day, rng.randint(0, 23), rng.choice([0, 30]), tzinfo=timezone.utc)
+            break
+        except ValueError:
+            continue
+    duration = rng.choice([timedelta(minutes=30), timedelta(hours=2), timedelta(days=1), timedelta(days=40)])
+    return start_time, duration, rng.choice([1, 12])
+
+def test_matches_reference_on_random_series_and_ranges():
+    rng = Random(0)
+    for _ in range(5000):
+        start_time, duration, repeat_months = random_event(rng)
+
+        # Ends the series at a random time, exactly at an instance, or never
+        until = rng.choice([
+            None,
+            start_time + timedelta(days=rng.randint(0, 3000)),
+            start_time.replace(year=start_time.year + rng.randint(0, 8)) if (start_time.month, start_time.day) != (2, 29) else None
+        ])
+
+        # Ranges anywhere around the series, including ones ending exactly at or starting exactly at the end of an instance
+        range_start = start_time + timedelta(days=rng.randint(-400, 4000), hours=rng.randint(0, 23))
+        range_end = range_start + rng.choice([timedelta(hours=1), timedelta(days=1), timedelta(days=7), timedelta(days=31), timedelta(days=800)])
+        instances = get_reference_instance_start_times(start_time, duration, None, repeat_months, start_time, range_end + timedelta(days=800))
+        if (len(instances) != 0 and rng.random() < 0.3):
+            instance_start_time = rng.choice(instances)
+            if (rng.random() < 0.5):
+                range_end = instance_start_time
+                range_start = range_end - timedelta(days=rng.randint(1, 400))
+            else:
+                range_start = instance_start_time + duration
+                range_end = range_start + timedelta(days=rng.randint(1, 400))
+
+        args = (start_time, duration, until, repeat_months, range_start, range_end)
+        assert expand(*args) == get_reference_instance_start_times(*args), args
+
+def test_month_end_instances_skip_short_months():
+    start_time = datetime(2023, 1, 31, 9, tzinfo=timezone.utc)
+    instances = expand(start_time, timedelta(hours=1), None, 1, start_time, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert [instance.month for instance in instances] == [1, 3, 5, 7, 8, 10, 12]
+
+def test_feb_29_yearly_instances_only_fall_in_leap_years():
+    start_time = datetime(2024, 2, 29, 12, tzinfo=timezone.utc)
+    instances = expand(start_time, timedelta(hours=1), None, 12, start_time, datetime(2037, 1, 1, tzinfo=timezone.utc))
+    assert [instance.year for instance in instances] == [2024, 2028, 2032, 2036]
+
+def test_range_ending_at_an_instance_excludes_it():
+    start_time = datetime(2024, 1, 10, 8, tzinfo=timezone.utc)
+    range_end = datetime(2024, 3, 10, 8, tzinfo=timezone.utc)
+    instances = expand(start_time, timedelta(hours=1), None, 1, datetime(2024, 1, 1, tzinfo=timezone.utc), range_end)
+    assert instances == [start_time, datetime(2024, 2, 10, 8, tzinfo=timezone.utc)]
+
+def test_until_at_an_instance_includes_it():
+    start_time = datetime(2024, 1, 10, 8, tzinfo=timezone.utc)
+    until = datetime(2024, 3, 10, 8, tzinfo=timezone.utc)
+    instances = expand(start_time, timedelta(hours=1), until, 1, start_time, datetime(2025, 1, 1, tzinfo=timezone.utc))
+    assert instances == get_reference_instance_start_times(start_time, timedelta(hours=1), until, 1, start_time, datetime(2025, 1, 1, tzinfo=timezone.utc))
+    assert instances[-1] == until
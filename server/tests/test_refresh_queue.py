@@ -0,0 +1,62 @@
+from datetime import date
+from uuid import uuid4
+import asyncio
+
+from lib.refresh_queue import InMemoryRefreshQueue
+
+async def drain(queue: InMemoryRefreshQueue) -> list:
+    jobs = []
+    while ((job := await queue.pop(timeout=0.01)) != None):
+        jobs.append(job)
+    return jobs
+
+def test_jobs_for_the_same_user_are_merged():
+    async def run():
+        queue = InMemoryRefreshQueue()
+        user_id = uuid4()
+        for day in (5, 6, 7):
+            await queue.push(user_id, date(2026, 1, day))
+        return user_id, await drain(queue)
+
+    user_id, jobs = asyncio.run(run())
+    assert [job[0] for job in jobs] == [user_id]
+
+def test_merged_jobs_keep_the_earliest_date():
+    async def run():
+        queue = InMemoryRefreshQueue()
+        user_id = uuid4()
+        await queue.push(user_id, date(2026, 1, 7))
+        await queue.push(user_id, date(2026, 1, 3))
+        await queue.push(user_id, date(2026, 1, 9))
+        return user_id, await drain(queue)
+
+    user_id, jobs = asyncio.run(run())
+    assert jobs == [(user_id, date(2026, 1, 3))]
+
+def test_users_are_queued_in_order_of_their_first_job():
+    async def run():
+        queue = InMemoryRefreshQueue()
+        first_user_id, second_user_id = uuid4(), uuid4()
+        await queue.push(first_user_id, date(2026, 1, 5))
+        await queue.push(second_user_id, date(2026, 1, 1))
+        await queue.push(first_user_id, date(2026, 1, 2))
+        return first_user_id, second_user_id, await drain(queue)
+
+    first_user_id, second_user_id, jobs = asyncio.run(run())
+    assert jobs == [(first_user_id, date(2026, 1, 2)), (second_user_id, date(2026, 1, 1))]
+
+def test_users_are_queued_again_after_their_job_is_taken():
+    async def run():
+        queue = InMemoryRefreshQueue()
+        user_id = uuid4()
+        await queue.push(user_id, date(2026, 1, 3))
+        first_job = await queue.pop(timeout=0.01)
+        await queue.push(user_id, date(2026, 1, 8))
+        return user_id, first_job, await drain(queue)
+
+    user_id, first_job, jobs = asyncio.run(run())
+    assert first_job == (user_id, date(2026, 1, 3))
+    assert jobs == [(user_id, date(2026, 1, 8))]
+
+def test_pop_returns_none_when_empty():
+    assert asyncio.run(InMemoryRefreshQueue().pop(timeout=0.01)) == None
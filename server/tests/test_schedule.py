@@ -0,0 +1,37 @@
+from datetime import time
+import asyncio
+
+import app # Registers every model with the ORM
+from models.schedule_item import ScheduleItem, ScheduleItemTypeEnum
+from lib.schedule import repair_daily_items, get_schedule_item_time_block
+
+WORK_SESSIONS = [("Work session", 3600, ScheduleItemTypeEnum.FOCUS_SESSION)] * 4
+OUTSIDE_WORK_HOURS = [(18 * 3600, 24 * 3600), (0, 8 * 3600)]
+
+def create_work_sessions(start_hours: list[int]) -> list[ScheduleItem]:
+    return [
+        ScheduleItem(name="Work session", start_time=time(hour), end_time=time(hour + 1), schedule_item_type=ScheduleItemTypeEnum.FOCUS_SESSION)
+        for hour in start_hours
+    ]
+
+def repair_work_sessions(previous_schedule_items: list[ScheduleItem], best_focus_times: list[tuple[int, int]], break_length: int) -> list[ScheduleItem]:
+    schedule_items, unplaced_items = asyncio.run(repair_daily_items(previous_schedule_items, OUTSIDE_WORK_HOURS, WORK_SESSIONS, [best_focus_times] * 4, break_length))
+    assert unplaced_items == []
+    return schedule_items
+
+def test_unchanged_sessions_are_kept():
+    previous_schedule_items = create_work_sessions([9, 10, 11, 12])
+    schedule_items = repair_work_sessions(previous_schedule_items, [(9 * 3600, 13 * 3600)], 0)
+    assert schedule_items == previous_schedule_items
+
+def test_sessions_move_to_new_focus_times():
+    # Only the best focus times changed, with no new events in the way
+    schedule_items = repair_work_sessions(create_work_sessions([9, 10, 11, 12]), [(14 * 3600, 17 * 3600)], 0)
+    start_times = sorted(schedule_item.start_time for schedule_item in schedule_items)
+    assert sum(time(14) <= start_time < time(17) for start_time in start_times) == 3
+
+def test_sessions_move_apart_for_a_new_break_length():
+    # Only the break length changed, so back to back sessions no longer leave enough time between them
+    schedule_items = repair_work_sessions(create_work_sessions([9, 10, 11, 12]), [(8 * 3600, 18 * 3600)], 1800)
+    time_blocks = sorted(get_schedule_item_time_block(schedule_item) for schedule_item in schedule_items)
+    assert all(next_start - end >= 1800 for (_, end), (next_start, _) in zip(time_blocks, time_blocks[1:]))